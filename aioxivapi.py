@@ -0,0 +1,275 @@
+"""
+    asyncio counterpart of xivapi and utils.download_file, for embedding pyXiv in an event loop.
+
+    needs aiohttp. urls, response parsing, the response cache and the local index are shared with the sync path:
+
+        async with aioxivapi.AsyncClient(concurrency=8) as client:
+            feeds = await asyncio.gather(*[client.do_query(id_list=chunk) for chunk in chunks])
+            await client.download(entry.pdf_url, "paper.pdf")
+
+    async_do_query, async_iter_query and async_download run a single call with a client of their own.
+"""
+
+import asyncio
+import concurrent.futures
+import io
+import os
+import time
+
+import aiohttp
+
+import const
+import ratelimit
+import stats
+import utils
+import xivapi
+
+
+class AsyncClient:
+    """
+        one aiohttp session with bounded concurrency and rate limits, shared by all calls made through it.
+
+        the rate limits are the adaptive ones of the command line tool, kept in the same state files: api requests
+        and downloads are spaced together with every other pyXiv process on the host, and slow down for all of them
+        when the server pushes back. api requests are retried like xivapi.request.
+
+        :param concurrency: max requests in flight.
+        :param rate: max api requests per second.
+        :param download_rate: max download requests per second.
+        :param retries: retries of a failed api request.
+        :param timeout: (connect, read) timeouts in seconds.
+        :param workers: threads that run the blocking parts of a query (response cache, parsing, local index).
+    """
+
+    def __init__(self, concurrency=4, rate=1 / const.API_DELAY, download_rate=const.DOWNLOAD_RATE,
+                 timeout=const.HTTP_TIMEOUT, user_agent=const.USER_AGENT, workers=2, retries=const.API_RETRIES):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.limiter = ratelimit.AdaptiveLimiter(rate, path=xivapi.api_limiter.path)
+        self.download_limiter = ratelimit.AdaptiveLimiter(download_rate,
+                                                          path=os.path.join(const.RATE_STATE_DIR, "download.json"))
+        self.retries = retries
+        self.timeout = aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+        self.user_agent = user_agent
+        self.workers = workers
+        self.session = None
+        self.executor = None
+
+    async def __aenter__(self):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers)
+        self.session = aiohttp.ClientSession(
+            timeout=self.timeout, headers={"User-Agent": self.user_agent},
+            connector=aiohttp.TCPConnector(limit_per_host=const.HTTP_POOL_SIZE))
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+        self.session = None
+        self.executor.shutdown(wait=True)
+        self.executor = None
+
+    def _run_blocking(self, func, *args):
+        # file and sqlite i/o must not stall the event loop
+        return asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def load_stream(self, url, headers=None):
+        """
+            :return: (resp, content) like xivapi.load_stream
+        """
+        async with self.semaphore:
+            t = time.perf_counter()
+            async with self.session.get(url, headers=headers) as r:
+                content = await r.read()
+                stats.recorder.record("request", time.perf_counter() - t, url=url, status=r.status, bytes=len(content))
+                resp = {k.lower(): v for k, v in r.headers.items()}
+                resp["status"] = str(r.status)
+                return resp, content
+
+    async def request(self, url, headers=None):
+        """
+            load_stream with the shared api rate limit and the retries of xivapi.request.
+
+        :return: (resp, content) of the last attempt.
+        """
+        for attempt in range(self.retries + 1):
+            await self.limiter.acquire_async(executor=self.executor)
+            try:
+                resp, content = await self.load_stream(url, headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt == self.retries:
+                    raise
+                resp, content = {"status": None}, None
+
+            # reward / penalize write the state file
+            wait = await self._run_blocking(xivapi.retry_policy, resp, attempt, self.retries, self.limiter)
+            if wait is None:
+                return resp, content
+
+            await asyncio.sleep(wait)
+            status = resp["status"]
+            stats.recorder.record("wait", wait, url=url, status=int(status) if status is not None else None, retries=1)
+
+    async def do_query(self, search_query=None, id_list=None, start=0, max_results=10, keep_xml=False):
+        """
+            see xivapi.do_query
+        """
+        url = xivapi.query_url(search_query, id_list, start, max_results)
+
+        cont = await self._run_blocking(xivapi.response_cache.get, url)
+        if cont is not None:
+            resp = {"status": "200"}
+        else:
+            stale = await self._run_blocking(xivapi.response_cache.stale, url)
+            resp, cont = await self.request(url, utils.conditional_headers(stale[1]) if stale is not None else None)
+            if resp['status'] == '304' and stale is not None:
+                resp['status'], cont = '200', stale[0]
+                await self._run_blocking(xivapi.response_cache.renew, url)
+            elif resp['status'] == '200':
+                await self._run_blocking(xivapi.response_cache.put, url, cont, utils.response_validators(resp))
+
+        if resp['status'] == '200':
+            # parse_response also saves the entries to the local index
+            resp["feed"] = await self._run_blocking(xivapi.parse_response, cont, keep_xml)
+        else:
+            resp["feed"] = None
+
+        return resp
+
+    async def iter_query(self, search_query=None, id_list=None, start=0, max_results=None,
+                         page_size=const.PAGE_SIZE):
+        """
+            async generator of model.Entry, see xivapi.iter_query. the next page is fetched by a task while the
+            current one is consumed.
+        """
+        end = None if max_results is None else start + max_results
+
+        def fetch(offset):
+            count = page_size if end is None else min(page_size, end - offset)
+            return asyncio.ensure_future(self.do_query(search_query=search_query, id_list=id_list,
+                                                       start=offset, max_results=count))
+
+        offset = start
+        pending = fetch(offset)
+        try:
+            while pending is not None:
+                resp = await pending
+                pending = None
+
+                feed = resp["feed"]
+                if feed is None:
+                    return
+
+                offset += len(feed.entries)
+                if end is None or end > feed.total:
+                    end = feed.total
+
+                if len(feed.entries) > 0 and offset < end:
+                    pending = fetch(offset)
+
+                for e in feed.entries:
+                    yield e
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+    async def download(self, url, filename):
+        """
+            download url into filename, resumable like utils.download_file (without progress bar). file i/o runs in
+            the worker threads.
+
+        :return: True if the file is downloaded, False if the server refused the request or the transfer is incomplete.
+        """
+        if await self._run_blocking(os.path.exists, filename):
+            return True
+
+        part_name = filename + ".part"
+        headers = {"Accept-Encoding": "identity"}
+        part, len_loaded = await self._run_blocking(_resume_part, part_name, url)
+        if len_loaded > 0:
+            headers.update(utils.resume_headers(part, len_loaded))
+
+        await self.download_limiter.acquire_async(executor=self.executor)
+        async with self.semaphore:
+            async with self.session.get(url, headers=headers) as r:
+                # like utils.download_file, pushback slows down the downloads of every process
+                if r.status in [429, 503]:
+                    await self._run_blocking(self.download_limiter.penalize,
+                                             utils.retry_after_seconds(r.headers.get("retry-after")))
+                elif r.status < 400:
+                    await self._run_blocking(self.download_limiter.reward)
+
+                current = utils.response_validators({k.lower(): v for k, v in r.headers.items()})
+                if r.status in [206, 416] and not utils.same_document(part, current):
+                    await self._run_blocking(utils.remove_part, part_name)
+                    return False
+
+                if r.status == 416:
+                    len_total = utils.content_range_total(r.headers.get("content-range"))
+                    if len_total is not None and len_total == len_loaded:
+                        await self._run_blocking(_finish_part, part_name, filename, len_loaded)
+                        return True
+                    return False
+
+                if r.status == 206:
+                    mode = 'r+b'
+                    len_total = utils.content_range_total(r.headers.get("content-range"))
+                elif r.status == 200:
+                    mode = 'wb'
+                    len_loaded = 0
+                    len_total = None
+                else:
+                    return False
+
+                if len_total is None and r.content_length is not None:
+                    len_total = len_loaded + r.content_length
+
+                if mode == 'wb':
+                    await self._run_blocking(utils.save_part_validators, part_name, url, current)
+                f_out = await self._run_blocking(io.open, part_name, mode)
+                try:
+                    await self._run_blocking(f_out.seek, len_loaded)
+                    async for chunk in r.content.iter_chunked(1024 * 128):
+                        len_loaded += len(chunk)
+                        await self._run_blocking(f_out.write, chunk)
+                finally:
+                    await self._run_blocking(f_out.close)
+
+        if len_total is not None and len_loaded != len_total:
+            return False
+
+        await self._run_blocking(_finish_part, part_name, filename, len_loaded)
+        return True
+
+
+def _resume_part(part_name, url):
+    # :return: (validators of the .part file, bytes to resume from), a .part file that can not be resumed is removed
+    len_loaded = utils.part_offset(part_name)
+    if len_loaded == 0:
+        return None, 0
+    part = utils.load_part_validators(part_name, url)
+    if part is None:
+        utils.remove_part(part_name)
+        return None, 0
+    return part, len_loaded
+
+
+def _finish_part(part_name, filename, length):
+    if os.path.getsize(part_name) != length:
+        os.truncate(part_name, length)
+    os.replace(part_name, filename)
+    utils.remove_part(part_name)
+
+
+async def async_do_query(*args, **kwargs):
+    async with AsyncClient() as client:
+        return await client.do_query(*args, **kwargs)
+
+
+async def async_iter_query(*args, **kwargs):
+    async with AsyncClient() as client:
+        async for e in client.iter_query(*args, **kwargs):
+            yield e
+
+
+async def async_download(url, filename):
+    async with AsyncClient() as client:
+        return await client.download(url, filename)
@@ -1,7 +1,7 @@
 #!/usr/bin/python3
 
 import sys
-import time
+import os
 import io
 
 # arxiv protocols implementations
@@ -10,18 +10,23 @@ import oaipmh
 
 import utils
 import const
+import model
+import ratelimit
+import localdb
+import stats
+import catalog
+import watch
+import serve
+import importer
 
 # data serialization and parsing
 import re
 import argparse
 import json
+import csv
 
 
-def cmd_download(cmd, args, show_help_only=False):
-
-    par = argparse.ArgumentParser(prog="arxiv " + cmd, add_help=False,
-                                  description="Download arXiv articles by its ID or name.")
-
+def add_download_arguments(par):
     par.add_argument("-o", "--output", type=str, default="./", required=False,
                      help="Output location for downloaded documents.")
 
@@ -34,6 +39,47 @@ def cmd_download(cmd, args, show_help_only=False):
     par.add_argument("-M", "--no-meta", default=False, action="store_true",
                      help="Don't save metadata while downloding.")
 
+    par.add_argument("-j", "--jobs", type=int, default=1,
+                     help="Number of concurrent downloads.")
+
+    par.add_argument("-r", "--rate", type=float, default=const.DOWNLOAD_RATE,
+                     help="Max download requests per second shared by all jobs, (default: %.2f)" % const.DOWNLOAD_RATE)
+
+    par.add_argument("-C", "--catalog", default=False, action="store_true",
+                     help="Append metadata to a single catalog.jsonl in the output directory instead of one "
+                          ".metainfo.json per article. A directory that has a catalog always uses it.")
+
+    par.add_argument("--compress", type=str, default=None, choices=["gzip", "zstd"],
+                     help="Compression of a new catalog (zstd needs the zstandard package).")
+
+    par.add_argument("-V", "--verify", default=False, action="store_true",
+                     help="Check the sha256 digest of already downloaded documents, not only their size.")
+
+
+def check_download_arguments(cmd, arg):
+    """
+        :return: False, after printing the error, if the download arguments can not be used. checked before any
+            article is looked up.
+    """
+    try:
+        catalog.Catalog(arg.output, arg.compress)
+    except ValueError as e:
+        print("arxiv " + cmd + ": error:", e, file=sys.stderr)
+        return False
+    return True
+
+
+def cmd_download(cmd, args, show_help_only=False):
+
+    par = argparse.ArgumentParser(prog="arxiv " + cmd, add_help=False,
+                                  description="Download arXiv articles by its ID or name.")
+
+    add_download_arguments(par)
+
+    par.add_argument("-t", "--threshold", type=float, default=const.TITLE_MATCH_THRESHOLD,
+                     help="Min similarity (0-1) for a title to be resolved from the local index instead of a search, "
+                          "above 1 always searches. (default: %.2f)" % const.TITLE_MATCH_THRESHOLD)
+
     par.add_argument("article", metavar="ARTICLE", nargs="+",
                      help="Article IDs(like 1801.00001) or article title to download.")
 
@@ -45,66 +91,342 @@ def cmd_download(cmd, args, show_help_only=False):
 
     if cmd in ["get", "download"]:
         arg = par.parse_args(args)
+        if not check_download_arguments(cmd, arg):
+            return
+
+        # articles given by ID are looked up together with batched id_list queries
+        resolved = xivapi.resolve_ids([each for each in arg.article if xivapi.check_id(each)])
 
+        found_list = []
         for each in arg.article:
 
             if xivapi.check_id(each):
-                # download article by its id
-                resp = xivapi.do_query(id_list=each, max_results=1)
-                query = "id"
+                found = resolved[each]
                 prompt_name = "[arXiv:" + each + "]"
             else:
-                resp = xivapi.do_query(search_query=each, max_results=1)
-                query = "title"
+                found = None
                 prompt_name = '"' + each + '"'
 
-            if (resp is not None) and ("feed" in resp) and (resp["feed"] is not None):
+                # titles of articles seen before resolve without a search request
+                match = None
+                if arg.threshold <= 1 and not xivapi.response_cache.refresh:
+                    match = localdb.index.match_title(each, threshold=arg.threshold)
+                if match is not None:
+                    found = (model.Feed(total=1, count=1, entries=[match[0]]), match[0])
+                else:
+                    resp = xivapi.do_query(search_query=each, max_results=1)
+                    if (resp is not None) and ("feed" in resp) and (resp["feed"] is not None):
+                        if len(resp["feed"].entries) > 0:
+                            found = (resp["feed"], resp["feed"].entries[0])
+
+            if found is None:
+                print("[Error] Failed to download", prompt_name + ":\n", "\tno such article with this id.")
+                continue
+
+            found_list.append(found + (prompt_name,))
+
+        download_entries(arg, found_list)
+
+
+def download_entries(arg, found_list):
+    """
+        save metadata and documents of resolved articles into arg.output, see prepare_entry.
+
+    :param found_list: list of (feed, entry, prompt name)
+    :return: IDs of the articles that failed to download.
+    """
+
+    os.makedirs(arg.output, exist_ok=True)
+
+    store = catalog.Catalog(arg.output, arg.compress)
+    if not (arg.catalog or store.exists()):
+        store = None
+    records = []
+
+    tasks = []
+    for feed, entry, prompt_name in found_list:
+        task = prepare_entry(arg, feed, entry, prompt_name, store, records)
+        if task is not None:
+            tasks.append(task)
+
+    if store is not None:
+        store.append(records)
+
+    if len(tasks) == 0:
+        return set()
+    return download_tasks(arg, tasks, store)
+
+
+def download_tasks(arg, tasks, store=None):
+    """
+        :return: IDs of the articles that failed to download.
+    """
+
+    limiter = ratelimit.AdaptiveLimiter(arg.rate, path=os.path.join(const.RATE_STATE_DIR, "download.json"))
+
+    for _, fname, _, _, previous in tasks:
+        print("Checking:" if previous is not None else "Downloading:", fname)
+
+    results = utils.download_batch(
+        [(url, arg.output + "/" + fname + ".pdf", None if previous is None else file_validators(previous))
+         for url, fname, _, _, previous in tasks], user_agent=const.USER_AGENT, jobs=arg.jobs, limiter=limiter)
+
+    records = []
+    failed = set()
+    n_done = 0
+    for (_, fname, prompt_name, entry, previous), (_, _, error, info) in zip(tasks, results):
+        if error is None:
+            n_done += 1
+            if info.get("skipped"):
+                # written by another run since the task was prepared
+                print("[info]  article", prompt_name, "already downloaded\n", "\t saved as:", fname + ".pdf")
+                continue
+            file_record = None
+            if info.get("not_modified"):
+                print("[info]  article", prompt_name, "not modified\n", "\t saved as:", fname + ".pdf")
+                if previous:
+                    # the document is confirmed current for this version
+                    file_record = dict(previous, version=entry.version, updated=entry.updated)
+                    file_record.update(file_validators(info))
+            elif "sha256" in info:
+                file_record = {"name": fname + ".pdf", "size": info["size"], "sha256": info["sha256"],
+                               "version": entry.version, "updated": entry.updated}
+                file_record.update(file_validators(info))
+            if not arg.no_meta and file_record is not None:
+                if store is not None:
+                    records.append(catalog.entry_record(entry, file_record))
+                else:
+                    record_file(arg.output + "/" + fname + ".metainfo.json", file_record)
+            if not info.get("not_modified"):
+                print("[info]  article", prompt_name, "downloaded\n", "\t saved as:", fname + ".pdf")
+        else:
+            failed.add(entry.id)
+            print("[Error] Failed to download", prompt_name + ":\n", "\t" + error)
+
+    if store is not None:
+        store.append(records)
 
-                if len(resp["feed"]["entries"]) > 0:
+    print("[info] ", n_done, "of", len(tasks), "articles downloaded.")
+    return failed
 
-                    for rl in resp["feed"]["entries"][0]["related-links"]:
 
-                        if ("title" in rl) and ("pdf" in rl["title"]):
-                            entry = resp["feed"]["entries"][0]
+def prepare_entry(arg, feed, entry, prompt_name, store=None, records=None):
+    """
+        save metadata of an entry and return its download task (pdf url, file name, prompt name, entry, previous),
+        returns None if nothing is left to download.
 
-                            f_id = entry["url"].replace("://arxiv.org/abs/", "").replace("http", "").replace("https", "").replace("/", "-")
-                            fname = arg.name.replace("{id}", f_id).replace("{title}", resp["feed"]["entries"][0]["title"])
+        metadata is only written when the version or updated time of the entry differ from the recorded ones. a
+        document that exists already is skipped, unless it was saved from another version: then previous is its
+        file record, and the task revalidates it against the etag / last-modified recorded there. the version a
+        document was saved from is kept in its file record, which is only written once the document is downloaded
+        or confirmed, so a failed transfer is retried by the next run.
 
-                            if "authors" in entry and len(entry["authors"]) > 0:
-                                fname = fname.replace("{auth_prim}", entry["authors"][0])
-                            else:
-                                fname = fname.replace("{auth_prim}", "N.A")
+        with a catalog (store), the metadata record is added to records instead, to be appended in one block.
+    """
 
-                            if "category" in entry and "term" in entry["category"]:
-                                fname = fname.replace("{category}", entry["category"]["term"])
-                            else:
-                                fname = fname.replace("{category}", "no.cate")
+    pdf_url = entry.pdf_url
+    if pdf_url is None:
+        print("[Error] Failed to download", prompt_name + ":\n",
+              "\tserver refused to return the link to pdf of this article.")
+        return None
 
-                            fname = utils.filename_filter(fname)
+    f_id = entry.url.replace("://arxiv.org/abs/", "").replace("http", "").replace("https", "").replace("/", "-")
+    fname = arg.name.replace("{id}", f_id).replace("{title}", entry.title)
 
-                            if not arg.no_meta or arg.meta_only:
-                                f_meta = io.open(arg.output + "/" + fname + ".metainfo.json", "w")
-                                s = json.dumps(resp["feed"], indent=4)
-                                f_meta.write(s + "\n")
-                                f_meta.close()
+    if len(entry.authors) > 0:
+        fname = fname.replace("{auth_prim}", entry.authors[0])
+    else:
+        fname = fname.replace("{auth_prim}", "N.A")
 
-                            if arg.meta_only:
-                                break
+    if entry.primary_category is not None:
+        fname = fname.replace("{category}", entry.primary_category)
+    else:
+        fname = fname.replace("{category}", "no.cate")
 
-                            print("Downloading:", fname)
-                            time.sleep(3)
-                            utils.download_file(rl["href"], arg.output + "/" + fname + ".pdf", user_agent=const.USER_AGENT)
+    fname = utils.filename_filter(fname)
 
-                            print("[info]  article", prompt_name, "downloaded\n", "\t saved as:", fname + ".pdf")
-                            break
-                    else:
-                        print("[Error] Failed to download", prompt_name + ":\n",
-                              "\tserver refused to return the link to pdf of this article.")
-                else:
-                    print("[Error] Failed to download", prompt_name + ":\n", "\tno such article with this id.")
+    f_pdf = arg.output + "/" + fname + ".pdf"
+    f_meta_name = arg.output + "/" + fname + ".metainfo.json"
+
+    # version and updated time of the article when it was saved before, and size, digest and validators of its
+    # document, recorded in its metadata
+    recorded, file_record = None, None
+    if store is not None:
+        record = store.get(entry.id)
+        if record is not None:
+            recorded = (record.get("version"), record.get("updated"))
+            file_record = record.get("file")
+            if file_record is not None and file_record.get("name") != fname + ".pdf":
+                file_record = None
+    elif os.path.exists(f_meta_name):
+        try:
+            with io.open(f_meta_name, "r") as f:
+                meta = json.load(f)
+            file_record = meta.get("file")
+            saved = model.Entry.from_dict(meta["entries"][0])
+            recorded = (saved.version, saved.updated)
+        except (ValueError, KeyError, IndexError):
+            pass
+
+    unchanged = recorded == (entry.version, entry.updated)
+
+    if not arg.meta_only and os.path.exists(f_pdf) and file_record is not None:
+        if not utils.verify_file(f_pdf, size=file_record.get("size"),
+                                 sha256=file_record.get("sha256") if arg.verify else None):
+            print("[info]  article", prompt_name, "does not match its recorded checksum, downloading again.")
+            os.remove(f_pdf)
+            file_record = None
+
+    if unchanged:
+        # metadata on disk is current
+        pass
+
+    elif store is not None and (not arg.no_meta or arg.meta_only):
+        records.append(catalog.entry_record(entry, file_record))
+
+    elif not arg.no_meta or arg.meta_only:
+        # a batched feed holds other articles as well, only keep this entry in its metadata.
+        meta = model.Feed(title=feed.title, title_attrib=feed.title_attrib, total=feed.total,
+                          start_index=feed.start_index, count=feed.count, entries=[entry])
+
+        meta = meta.to_dict()
+        if file_record is not None:
+            meta["file"] = file_record
+
+        f_meta = io.open(f_meta_name, "w")
+        s = json.dumps(meta, indent=4)
+        f_meta.write(s + "\n")
+        f_meta.close()
+
+    if arg.meta_only:
+        return None
 
+    # version and updated time the document was saved from, file records written before they were kept in it
+    # only have the metadata's
+    saved = recorded
+    if file_record is not None and "version" in file_record:
+        saved = (file_record.get("version"), file_record.get("updated"))
+
+    if os.path.exists(f_pdf) and (saved is None or saved == (entry.version, entry.updated)):
+        print("[info]  article", prompt_name, "already downloaded\n", "\t saved as:", fname + ".pdf")
+        return None
+
+    # a document saved under the same name from another version or revision is checked with a conditional
+    # request, against the validators recorded with it
+    previous = None
+    if os.path.exists(f_pdf):
+        previous = file_record if file_record is not None else {}
+
+    return pdf_url, fname, prompt_name, entry, previous
+
+
+def file_validators(record):
+    """
+        :return: the etag and last-modified in a file record or download result, see utils.download_file.
+    """
+    return {k: record[k] for k in ["etag", "last_modified"] if record.get(k)}
+
+
+def record_file(f_meta_name, file_record):
+    """
+        add name, size and sha256 digest of the downloaded document to its metadata file.
+    """
+
+    with io.open(f_meta_name, "r") as f:
+        meta = json.load(f)
+
+    meta["file"] = file_record
+
+    with io.open(f_meta_name, "w") as f:
+        f.write(json.dumps(meta, indent=4) + "\n")
+
+
+SEARCH_SCOPES = {"all": "all", "title": "ti", "abstract": "abs", "author": "au", "comment": "co", "category": "cat"}
+
+
+def print_entry(entry, brief=False, file=None):
+    if brief:
+        print("[arXiv:" + entry.id + (entry.version or "") + "]", " ".join(entry.title.split()), file=file)
+        return
+
+    print("[arXiv:" + entry.id + (entry.version or "") + "]", " ".join(entry.title.split()), file=file)
+    print("\t", ", ".join(entry.authors), file=file)
+    print("\t", entry.primary_category, "\tpublished:", entry.published, "\tupdated:", entry.updated, file=file)
+    print("\t", entry.url, file=file)
+    print(" ", file=file)
+
+
+def add_export_arguments(par):
+    par.add_argument("-o", "--output", type=str, default=None,
+                     help="Write results to this file instead of stdout.")
+
+    par.add_argument("-f", "--format", type=str, default=None, choices=["text", "jsonl", "csv"],
+                     help="Output format, (default: text on stdout, csv for a .csv file, jsonl for other files)")
+
+
+CSV_COLUMNS = ["id", "version", "title", "authors", "primary_category", "categories", "published", "updated", "url",
+               "pdf_url", "comment", "summary"]
+
+
+def export_entries(entries, output=None, fmt=None, brief=False):
+    """
+        write entries as they arrive, to output (a file name, stdout if None or "-") as text, jsonl or csv.
+        nothing is collected in memory, the output is flushed every page so results show up while paging goes on.
+
+    :param fmt: "text", "jsonl" or "csv", inferred from the extension of output if None.
+    :return: number of entries written.
+    """
+
+    if fmt is None:
+        if output is None or output == "-":
+            fmt = "text"
+        else:
+            fmt = "csv" if output.lower().endswith(".csv") else "jsonl"
+
+    to_stdout = output is None or output == "-"
+    f = sys.stdout if to_stdout else io.open(output, "w", encoding="utf8", newline="")
+
+    writer = csv.writer(f) if fmt == "csv" else None
+    if writer is not None:
+        writer.writerow(CSV_COLUMNS)
+
+    n = 0
+    try:
+        for entry in entries:
+            if fmt == "jsonl":
+                f.write(json.dumps(catalog.entry_record(entry), ensure_ascii=False) + "\n")
+            elif fmt == "csv":
+                writer.writerow([entry.id, entry.version or "", " ".join(entry.title.split()), "; ".join(entry.authors),
+                                 entry.primary_category or "", " ".join(entry.categories), entry.published or "",
+                                 entry.updated or "", entry.url, entry.pdf_url or "", entry.comment or "",
+                                 " ".join((entry.summary or "").split())])
             else:
-                print("[Error] Failed to download", prompt_name + ":\n", "\tno such article with this id.")
+                print_entry(entry, brief=brief, file=f)
+
+            n += 1
+            if n % const.PAGE_SIZE == 0:
+                f.flush()
+    finally:
+        if to_stdout:
+            f.flush()
+        else:
+            f.close()
+
+    return n
+
+
+def remote_entries(query_string, start=0, max_results=None, page_size=const.PAGE_SIZE):
+    """
+        entries of an api query, lazily page by page. a query string too long for one request is split into
+        sub-queries that run concurrently and are merged, see: xivapi.query
+    """
+    if len(query_string) <= const.MAX_QUERY_LENGTH:
+        return xivapi.iter_query(search_query=query_string, start=start, max_results=max_results, page_size=page_size)
+
+    entries, ok = xivapi.query(search_query=query_string, start=start, max_results=max_results)
+    if not ok:
+        print("arxiv: warning: some sub-queries failed, results are incomplete", file=sys.stderr)
+    return entries
 
 
 def cmd_query(cmd, args, show_help_only=False):
@@ -113,7 +435,7 @@ def cmd_query(cmd, args, show_help_only=False):
         par = argparse.ArgumentParser(prog="arxiv " + cmd, add_help=False,
                                       description="A simplified searching interface for subcommand query, search specified term in given scope.")
 
-        par.add_argument("-s", "--scope", type=str, default="all", required=False,
+        par.add_argument("-s", "--scope", type=str, default="all", required=False, choices=sorted(SEARCH_SCOPES),
                          help='Search scope, can be all(-sa), title, abstract, (default: all)')
 
         par.add_argument("-a", "--in-abstract", default=False, action="store_true",
@@ -125,11 +447,10 @@ def cmd_query(cmd, args, show_help_only=False):
         par.add_argument("-p", "--page", default=1, type=int,
                          help="specifies which page to show.")
 
-        par.add_argument("-o", "--output", type=str, default=None,
-                         help="save metadata to disk.")
+        par.add_argument("-l", "--local", default=False, action="store_true",
+                         help="Search the local metadata index instead of arXiv.")
 
-        par.add_argument("-n", "--name", default="{id}.{title}",
-                         help="Document namimg syntax. Available fields: {id}, {title}. --output=./ is inferred.")
+        add_export_arguments(par)
 
         par.add_argument("term", metavar="TERM", nargs="+", help="Seaching terms.")
 
@@ -139,12 +460,39 @@ def cmd_query(cmd, args, show_help_only=False):
 
         arg = par.parse_args(args)
 
+        scope = SEARCH_SCOPES["abstract" if arg.in_abstract else arg.scope]
 
+        # every term has to match in the given scope
+        op_tree = {"op": scope, "term": arg.term[0]}
+        for term in arg.term[1:]:
+            op_tree = {"op": "and", "term1": op_tree, "term2": {"op": scope, "term": term}}
 
-    elif cmd == "query":
+        if arg.local:
+            entries = localdb.index.iter_search(op_tree, start=(arg.page - 1) * arg.count, max_results=arg.count)
+        else:
+            entries = remote_entries(xivapi.get_query_string(op_tree), start=(arg.page - 1) * arg.count,
+                                     max_results=arg.count, page_size=arg.count)
+        export_entries(entries, arg.output, arg.format)
 
-        par = argparse.ArgumentParser(prog="arxiv " + cmd, add_help=False,
-                                      description="Query arXiv database for metadata.")
+    elif cmd in ["query", "list"]:
+
+        if cmd == "query":
+            par = argparse.ArgumentParser(prog="arxiv " + cmd, add_help=False,
+                                          description="Query arXiv database for metadata.")
+        else:
+            par = argparse.ArgumentParser(prog="arxiv " + cmd, add_help=False,
+                                          description="List all articles matching a given query string, one per line.")
+
+        par.add_argument("-c", "--count", default=10 if cmd == "query" else None, type=int,
+                         help="max number of results, (default: 10 for query, all results for list)")
+
+        par.add_argument("-s", "--start", default=0, type=int,
+                         help="index of the first result.")
+
+        par.add_argument("-l", "--local", default=False, action="store_true",
+                         help="Query the local metadata index instead of arXiv.")
+
+        add_export_arguments(par)
 
         par.add_argument("query", metavar="QUERY_STRING", nargs="+", help="arXiv query string, see: https://arxiv.org/help/api/user-manual#Appendices")
 
@@ -155,10 +503,30 @@ def cmd_query(cmd, args, show_help_only=False):
         arg = par.parse_args(args)
         query_string = " ".join(arg.query)
 
+        if arg.local:
+            op_tree = xivapi.parse_query_string(query_string)
+            if op_tree is None:
+                print("arxiv " + cmd + ": error: malformed query string:", query_string, file=sys.stderr)
+                return
+            entries = localdb.index.iter_search(op_tree, start=arg.start, max_results=arg.count)
+        else:
+            entries = remote_entries(query_string, start=arg.start, max_results=arg.count)
+
+        export_entries(entries, arg.output, arg.format, brief=(cmd == "list"))
 
 
 def cmd_show(cmd, args, show_help_only=False):
-    par = argparse.ArgumentParser(prog="arxiv " + cmd, description="", add_help=False)
+    par = argparse.ArgumentParser(prog="arxiv " + cmd, add_help=False,
+                                  description="Show metadata of downloaded articles from the catalog of a directory, "
+                                              "articles not in it are looked up in the local metadata index.")
+
+    par.add_argument("-d", "--dir", type=str, default="./",
+                     help="Directory of the catalog, (default: ./)")
+
+    par.add_argument("-j", "--json", default=False, action="store_true",
+                     help="Print records as json lines.")
+
+    par.add_argument("article", metavar="ARTICLE", nargs="+", help="Article IDs(like 1801.00001).")
 
     if show_help_only:
         par.print_help()
@@ -166,11 +534,180 @@ def cmd_show(cmd, args, show_help_only=False):
 
     arg = par.parse_args(args)
 
-    pass
+    store = catalog.Catalog(arg.dir)
+    for each in arg.article:
+        base_id, _ = xivapi.split_id_version(each)
+
+        record = store.get(base_id)
+        if record is None:
+            entry = localdb.index.get(base_id)
+            if entry is not None:
+                record = catalog.entry_record(entry)
+
+        if record is None:
+            print("[Error] article [arXiv:" + each + "] is not in the catalog or the local index.", file=sys.stderr)
+            continue
+
+        if arg.json:
+            print(json.dumps(record, ensure_ascii=False))
+            continue
+
+        entry = catalog.record_entry(record)
+        print("[arXiv:" + entry.id + (entry.version or "") + "]", " ".join(entry.title.split()))
+        print("\t", ", ".join(entry.authors))
+        print("\t", entry.primary_category, "\tpublished:", entry.published, "\tupdated:", entry.updated)
+        print("\t", entry.url)
+        print("\t", " ".join(entry.summary.split()))
+        if "file" in record:
+            print("\t file:", record["file"]["name"], "\tsize:", record["file"]["size"],
+                  "\tsha256:", record["file"]["sha256"])
+        print(" ")
 
 
 def cmd_oai(cmd, args, show_help_only=False):
-    par = argparse.ArgumentParser(prog="arxiv " + cmd, description="", add_help=False)
+    par = argparse.ArgumentParser(prog="arxiv " + cmd, add_help=False,
+                                  description="Bulk metadata harvesting over OAI-PMH, records are saved as json lines. "
+                                              "An interrupted harvest resumes from its checkpoint when run again.")
+
+    par.add_argument("verb", metavar="VERB", nargs="?", default="records", choices=["records", "identifiers"],
+                     help="records(ListRecords) or identifiers(ListIdentifiers), (default: records)")
+
+    par.add_argument("-o", "--output", type=str, default="./oai.jsonl",
+                     help="Output file, the checkpoint is kept next to it as OUTPUT.checkpoint")
+
+    par.add_argument("-f", "--from", dest="from_date", type=str, default=None,
+                     help="Harvest records changed on or after this date (YYYY-MM-DD).")
+
+    par.add_argument("-u", "--until", type=str, default=None,
+                     help="Harvest records changed on or before this date (YYYY-MM-DD).")
+
+    par.add_argument("-s", "--set", dest="set_spec", type=str, default=None,
+                     help="Set to harvest, like cs or physics:hep-th.")
+
+    par.add_argument("-p", "--prefix", type=str, default="arXiv",
+                     help="Metadata format: arXiv, arXivRaw or oai_dc, (default: arXiv)")
+
+    par.add_argument("--base-url", type=str, default=const.OAI_URL,
+                     help="OAI-PMH endpoint, (default: %s)" % const.OAI_URL)
+
+    par.add_argument("--restart", default=False, action="store_true",
+                     help="Ignore an existing checkpoint and start over.")
+
+    if show_help_only:
+        par.print_help()
+        return
+
+    arg = par.parse_args(args)
+
+    def on_page(state):
+        print("[info] ", state["count"], "records harvested, latest datestamp:", state["datestamp"])
+
+    try:
+        n = oaipmh.harvest(arg.output, verb="ListRecords" if arg.verb == "records" else "ListIdentifiers",
+                           metadata_prefix=arg.prefix, from_date=arg.from_date, until=arg.until,
+                           set_spec=arg.set_spec, restart=arg.restart, base_url=arg.base_url, on_page=on_page)
+    except oaipmh.OAIError as e:
+        print("[Error] Harvest failed:", e, "\n", "\trun the same command again to resume.", file=sys.stderr)
+        return
+
+    print("[info]  harvest complete,", n, "new records saved to", arg.output)
+
+
+def cmd_sync(cmd, args, show_help_only=False):
+    par = argparse.ArgumentParser(prog="arxiv " + cmd, add_help=False,
+                                  description="Fetch articles submitted since the last sync of each query in a watch "
+                                              "list. A query synced for the first time takes its newest articles.")
+
+    par.add_argument("watch_list", metavar="WATCH_LIST",
+                     help="json file with a list of op-trees, or an object that maps names to op-trees.")
+
+    par.add_argument("-d", "--download", default=False, action="store_true",
+                     help="Download new articles (and their metadata) into the output directory, "
+                          "otherwise they are only listed.")
+
+    par.add_argument("-c", "--count", type=int, default=None,
+                     help="Max new articles per query, (default: all since the last sync, %d on the first sync)"
+                          % const.SYNC_INITIAL)
+
+    par.add_argument("--state", type=str, default=const.SYNC_STATE,
+                     help="File of the last synced positions, (default: %s)" % const.SYNC_STATE)
+
+    add_download_arguments(par)
+
+    if show_help_only:
+        par.print_help()
+        return
+
+    arg = par.parse_args(args)
+    if arg.download and not check_download_arguments(cmd, arg):
+        return
+
+    try:
+        watch_list = watch.load_watch_list(arg.watch_list)
+    except (OSError, ValueError) as e:
+        print("arxiv " + cmd + ": error: can not read watch list:", e, file=sys.stderr)
+        return
+
+    state = watch.WatchState(arg.state)
+
+    # a cached page would hide what was submitted since it was fetched
+    xivapi.response_cache.refresh = True
+
+    synced = []
+    found_list = []
+    for name, query_string in watch_list:
+        mark = state.mark(query_string)
+        max_results = arg.count if arg.count is not None or mark is not None else const.SYNC_INITIAL
+        entries, ok = watch.new_entries(query_string, mark, max_results)
+        if not ok:
+            print("[Error] Failed to sync", name + ", run again to retry.", file=sys.stderr)
+            continue
+
+        print("[info] ", name + ":", len(entries), "new articles.")
+        for entry in entries:
+            print_entry(entry, brief=True)
+            found_list.append((model.Feed(total=1, count=1, entries=[entry]), entry, "[arXiv:" + entry.id + "]"))
+        synced.append((query_string, entries))
+
+    failed = set()
+    if arg.download and len(found_list) > 0:
+        # an article watched by several queries is saved once
+        unique = {}
+        for found in found_list:
+            unique.setdefault(found[1].id, found)
+        failed = download_entries(arg, list(unique.values()))
+
+    # a query whose new articles did not all download keeps its mark and fetches them again next time
+    for query_string, entries in synced:
+        if not any(e.id in failed for e in entries):
+            state.advance(query_string, entries)
+    state.save()
+
+
+def cmd_import(cmd, args, show_help_only=False):
+    par = argparse.ArgumentParser(prog="arxiv " + cmd, add_help=False,
+                                  description="Import metadata snapshots on disk: json lines dumps (the arXiv metadata "
+                                              "snapshot, `arxiv oai` harvests, catalogs) and saved API or OAI-PMH xml "
+                                              "pages, plain or compressed (.gz, .bz2, .zst). Files are parsed by a pool "
+                                              "of processes and saved to the local index and / or a catalog.")
+
+    par.add_argument("files", metavar="FILE", nargs="+",
+                     help="Files to import, directories are searched for .jsonl, .json and .xml files.")
+
+    par.add_argument("-o", "--output", type=str, default=None,
+                     help="Also write a catalog of the imported entries into this directory.")
+
+    par.add_argument("--compress", type=str, default=None, choices=["gzip", "zstd"],
+                     help="Compress the catalog when it is created.")
+
+    par.add_argument("--no-index", default=False, action="store_true",
+                     help="Don't save imported entries to the local index.")
+
+    par.add_argument("-j", "--jobs", type=int, default=None,
+                     help="Worker processes, (default: the number of cpus)")
+
+    par.add_argument("--chunk-size", type=int, default=2000,
+                     help="Json lines parsed and written per batch, (default: 2000)")
 
     if show_help_only:
         par.print_help()
@@ -178,6 +715,67 @@ def cmd_oai(cmd, args, show_help_only=False):
 
     arg = par.parse_args(args)
 
+    if arg.no_index and arg.output is None:
+        print("arxiv " + cmd + ": error: nothing to import into, give -o or drop --no-index", file=sys.stderr)
+        return
+
+    store = None
+    if arg.output is not None:
+        try:
+            store = catalog.Catalog(arg.output, arg.compress)
+        except ValueError as e:
+            print("arxiv " + cmd + ": error:", e, file=sys.stderr)
+            return
+
+    progress = {"file": None}
+
+    def on_batch(filename, n_written, n_skipped):
+        if filename != progress["file"]:
+            progress["file"] = filename
+            print("[info]  importing", filename)
+
+    try:
+        n_written, n_skipped = importer.import_files(arg.files, store=store, index=not arg.no_index, jobs=arg.jobs,
+                                                     chunk_size=arg.chunk_size, on_batch=on_batch)
+    except (OSError, ValueError) as e:
+        print("arxiv " + cmd + ": error:", e, file=sys.stderr)
+        return
+
+    print("[info] ", n_written, "entries imported,", n_skipped, "records skipped.")
+    if not arg.no_index and localdb.index.error is not None:
+        print("[Error] the local index could not be written:", localdb.index.error, file=sys.stderr)
+
+
+def cmd_serve(cmd, args, show_help_only=False):
+    par = argparse.ArgumentParser(prog="arxiv " + cmd, add_help=False,
+                                  description="Run a daemon that keeps HTTP connections, parsed API responses and the "
+                                              "rate limiter warm. While it runs, other arxiv commands are forwarded "
+                                              "to it over a unix socket (%s)." % const.SERVE_SOCKET)
+
+    par.add_argument("--stop", default=False, action="store_true",
+                     help="Shut down the running daemon.")
+
+    if show_help_only:
+        par.print_help()
+        return
+
+    arg = par.parse_args(args)
+
+    if arg.stop:
+        if not serve.stop():
+            print("arxiv " + cmd + ": error: no daemon is running", file=sys.stderr)
+        return
+
+    xivapi.feed_cache.enabled = True
+    server = serve.Server(run_command)
+    print("[info]  listening on", const.SERVE_SOCKET, file=sys.stderr)
+    try:
+        server.serve_forever()
+    except OSError as e:
+        print("arxiv " + cmd + ": error:", e, file=sys.stderr)
+    except KeyboardInterrupt:
+        pass
+
 
 def cmd_help(cmd, args):
 
@@ -191,38 +789,120 @@ def cmd_help(cmd, args):
         print(" ", "search   - search documents on arXiv.")
         print(" ", "list     - list articles matching a given query string.")
         print(" ", "oai      - metadata harvesting interface.")
+        print(" ", "sync     - fetch new articles of a watch list.")
+        print(" ", "import   - import metadata snapshots on disk.")
+        print(" ", "serve    - run a daemon that keeps connections and caches warm.")
         print(" ")
 
     else:
 
         if args[0] in ["download", "get"]:
             cmd_download(args[0], args, show_help_only=True)
-        elif args[0] in ["show", "list", "search"]:
+        elif args[0] in ["list", "search", "query"]:
             cmd_query(args[0], args, show_help_only=True)
-        elif args[0] in ["oai"]:
+        elif args[0] in ["show"]:
+            cmd_show(args[0], args, show_help_only=True)
+        elif args[0] in ["oai", "pmh", "oaipmh"]:
             cmd_oai(args[0], args, show_help_only=True)
+        elif args[0] in ["sync"]:
+            cmd_sync(args[0], args, show_help_only=True)
+        elif args[0] in ["import"]:
+            cmd_import(args[0], args, show_help_only=True)
+        elif args[0] in ["serve"]:
+            cmd_serve(args[0], args, show_help_only=True)
 
 
-def main():
+def parse_arguments(argv=None):
     par = argparse.ArgumentParser(prog="arxiv", description="A simple CLI for searching, download, batch harvest, and analyse arxiv documents.")
+    par.add_argument("--no-cache", default=False, action="store_true",
+                     help="Don't read or write the on-disk cache of API responses.")
+    par.add_argument("--refresh", default=False, action="store_true",
+                     help="Ignore cached API responses, fresh responses are still cached.")
+    par.add_argument("--timeout", type=float, default=None,
+                     help="Timeout of HTTP requests in seconds, (default: %d to connect, %d to read)" % const.HTTP_TIMEOUT)
+    par.add_argument("--stats", default=False, action="store_true",
+                     help="Print a summary of request, parsing, transfer and rate limit timings when done.")
+    par.add_argument("--trace", type=str, default=None, metavar="FILE",
+                     help="Append a json line per request, parse, transfer and wait event to FILE.")
+    par.add_argument("--no-daemon", default=False, action="store_true",
+                     help="Run the command in this process even if a daemon (arxiv serve) is running.")
     par.add_argument("command", metavar="COMMAND",
-                     help="Currently available commands are: search, query, show, list, download, get, oai, help")
+                     help="Currently available commands are: search, query, show, list, download, get, oai, sync, "
+                          "import, serve, help")
     par.add_argument("cmdargs", metavar="CMD_ARGS", type=str,
-                     nargs='*', help="article name or id to download")
-
-    args = par.parse_args()
-
-    if args.command in ["download", "get"]:
-        cmd_download(args.command, args.cmdargs)
-    elif args.command in ["show", "list", "search", "query"]:
-        cmd_query(args.command, args.cmdargs)
-    elif args.command in ["oai", "pmh", "oaipmh"]:
-        cmd_oai(args.command, args.cmdargs)
-    elif args.command in ["help"]:
-        cmd_help(args.command, args.cmdargs)
-    else:
-        print("arxiv: error: unsupported command:", args.command, file=sys.stderr)
+                     nargs=argparse.REMAINDER, help="arguments of the command, see: arxiv help COMMAND")
+
+    return par.parse_args(argv)
+
+
+def run_command(argv):
+    """
+        run a command line forwarded to the daemon, see: serve.Server
+    """
+    args = parse_arguments(argv)
+    if args.command in ["serve"]:
+        print("arxiv: error: the daemon does not run serve", file=sys.stderr)
+        return 2
+    return run(args)
+
+
+def run(args):
+    """
+        run the command of parsed arguments in this process.
+
+    :return: exit status.
+    """
+
+    # a daemon runs many commands, the options of one must not stay in effect for the next
+    xivapi.response_cache.enabled = not args.no_cache
+    xivapi.response_cache.refresh = args.refresh
+    utils.http_timeout = args.timeout if args.timeout is not None else const.HTTP_TIMEOUT
+
+    stats.recorder.reset()
+    stats.recorder.enabled = args.stats
+    if args.trace is not None:
+        stats.recorder.open_trace(args.trace)
+
+    try:
+        if args.command in ["download", "get"]:
+            cmd_download(args.command, args.cmdargs)
+        elif args.command in ["list", "search", "query"]:
+            cmd_query(args.command, args.cmdargs)
+        elif args.command in ["show"]:
+            cmd_show(args.command, args.cmdargs)
+        elif args.command in ["oai", "pmh", "oaipmh"]:
+            cmd_oai(args.command, args.cmdargs)
+        elif args.command in ["sync"]:
+            cmd_sync(args.command, args.cmdargs)
+        elif args.command in ["import"]:
+            cmd_import(args.command, args.cmdargs)
+        elif args.command in ["serve"]:
+            cmd_serve(args.command, args.cmdargs)
+        elif args.command in ["help"]:
+            cmd_help(args.command, args.cmdargs)
+        else:
+            print("arxiv: error: unsupported command:", args.command, file=sys.stderr)
+            return 2
+    finally:
+        stats.recorder.close()
+        if args.stats:
+            for line in stats.recorder.summary():
+                print("[stats]", line, file=sys.stderr)
+
+    return 0
+
+
+def main():
+    args = parse_arguments()
+
+    # with a daemon running the command goes to it, warm connections and caches included. import starts a process
+    # pool of its own and gains nothing from the daemon
+    if args.command not in ["serve", "help", "import"] and not args.no_daemon:
+        status = serve.forward(sys.argv[1:])
+        if status is not None:
+            sys.exit(status)
 
+    sys.exit(run(args))
 
 
 if __name__ == '__main__':
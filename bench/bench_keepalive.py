@@ -0,0 +1,83 @@
+"""
+    connection reuse of the shared http session, against a local http server that records the client port of every
+    request. with keep-alive working all requests arrive over a single connection.
+
+        python bench/bench_keepalive.py --requests 20
+
+    exits with status 1 if more connections than --max-connections were opened.
+"""
+
+import argparse
+import http.server
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import utils
+import xivapi
+import synthetic
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body are separate writes, with nagle on the body would wait for the client's delayed ack
+    disable_nagle_algorithm = True
+    ports = []
+    feed = synthetic.make_feed(10)
+    pdf = b"%PDF-1.4\n" + b"0" * (256 * 1024)
+
+    def do_GET(self):
+        Handler.ports.append(self.client_address[1])
+        body = Handler.pdf if self.path.startswith("/pdf/") else Handler.feed
+        self.send_response(200)
+        self.send_header("Content-Type", "application/pdf" if body is Handler.pdf else "application/atom+xml")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    par = argparse.ArgumentParser(description="Check that repeated requests reuse one connection.")
+    par.add_argument("-n", "--requests", type=int, default=20, help="requests of each kind.")
+    par.add_argument("--max-connections", type=int, default=1, help="connections allowed before failing.")
+    arg = par.parse_args()
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = "http://127.0.0.1:%d" % server.server_address[1]
+
+    t = time.perf_counter()
+    for i in range(arg.requests):
+        resp, _ = xivapi.load_stream(base + "/api/query?id_list=%d" % i)
+        assert resp["status"] == "200"
+    query_time = time.perf_counter() - t
+
+    with tempfile.TemporaryDirectory() as tmp:
+        t = time.perf_counter()
+        for i in range(arg.requests):
+            assert utils.download_file(base + "/pdf/%d" % i, os.path.join(tmp, "%d.pdf" % i), "bench",
+                                       show_progress=False)
+        download_time = time.perf_counter() - t
+
+    server.shutdown()
+
+    n_conn = len(set(Handler.ports))
+    print("{:<20s}{:>10d}".format("requests", len(Handler.ports)))
+    print("{:<20s}{:>10d}".format("connections", n_conn))
+    print("{:<20s}{:>10.2f}".format("ms/query", query_time * 1000 / arg.requests))
+    print("{:<20s}{:>10.2f}".format("ms/download", download_time * 1000 / arg.requests))
+
+    if n_conn > arg.max_connections:
+        print("connections are not reused", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+    memory per parsed entry and metadata file size, nested dicts (the old layout) against model.Entry.
+
+        python bench/bench_model.py --entries 5000
+"""
+
+import argparse
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import model
+import xivapi
+import synthetic
+
+
+def measure(build):
+    tracemalloc.start()
+    objs = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return objs, size
+
+
+def main():
+    par = argparse.ArgumentParser(description="Benchmark memory of the entry model.")
+    par.add_argument("-e", "--entries", type=int, default=5000, help="entries to parse.")
+    arg = par.parse_args()
+
+    cont = synthetic.make_feed(arg.entries)
+    _, dict_size = measure(lambda: [e.to_dict() for e in xivapi.iter_entries(cont)])
+    _, entry_size = measure(lambda: list(xivapi.iter_entries(cont)))
+
+    print("{:<28s}{:>12s}".format("", "bytes/entry"))
+    print("{:<28s}{:>12,.0f}".format("dict entries", dict_size / arg.entries))
+    print("{:<28s}{:>12,.0f}".format("model.Entry", entry_size / arg.entries))
+
+    # metadata file of a single article: feed dict with the raw response, against the compact feed
+    single = synthetic.make_feed(1)
+    feed = model.Feed(entries=list(xivapi.iter_entries(single)))
+    old_meta = feed.to_dict()
+    old_meta["xml"] = str(single, encoding="utf8")
+
+    print("{:<28s}{:>12s}".format("", "bytes/file"))
+    print("{:<28s}{:>12,d}".format("metainfo.json with xml", len(json.dumps(old_meta, indent=4))))
+    print("{:<28s}{:>12,d}".format("metainfo.json", len(json.dumps(feed.to_dict(), indent=4))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+    parse throughput and peak memory of the atom response parser.
+
+    each parser runs in its own process so peak rss is not shared between them:
+
+        python bench/bench_parse.py --entries 5000
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from lxml import etree
+
+import const
+import model
+import xivapi
+import synthetic
+
+
+def parse_dom(cont):
+    # the tree + xpath parser do_query used before xivapi.iter_entries, kept as a reference.
+    lxml_etree = etree.fromstring(str(cont, encoding="utf8").encode("utf8"))
+    ns = const.xml_namespace
+
+    entries = []
+    for e in lxml_etree.xpath("/atom:feed/atom:entry", namespaces=ns):
+        if len(e.xpath("./atom:id", namespaces=ns)) == 0:
+            continue
+        ent_prim_cate = dict(e.xpath("./arxiv:primary_category", namespaces=ns)[0].attrib)
+        ent_prim_cate["category"] = [dict(c.attrib) for c in e.xpath("./arxiv:primary_category/arxiv:category", namespaces=ns)]
+        summary = e.xpath("./atom:summary", namespaces=ns)
+        comment = e.xpath("./arxiv:comment", namespaces=ns)
+        entries.append({"url": e.xpath("./atom:id", namespaces=ns)[0].text,
+                        "time": {"updated": e.xpath("./atom:updated", namespaces=ns)[0].text,
+                                 "published": e.xpath("./atom:published", namespaces=ns)[0].text},
+                        "title": e.xpath("./atom:title", namespaces=ns)[0].text,
+                        "summary": summary[0].text if len(summary) > 0 else "",
+                        "comment": comment[0].text if len(comment) > 0 else "",
+                        "authors": [a.text for a in e.xpath("./atom:author/atom:name", namespaces=ns)],
+                        "related-links": [dict(l.attrib) for l in e.xpath("./atom:link", namespaces=ns)],
+                        "category": ent_prim_cate})
+    return entries
+
+
+def parse_stream(cont):
+    return list(xivapi.iter_entries(cont, model.Feed()))
+
+
+def count_stream(cont):
+    # consumers that handle entries one by one never hold the whole list
+    n = 0
+    for _ in xivapi.iter_entries(cont, model.Feed()):
+        n += 1
+    return n
+
+
+PARSERS = {"dom": parse_dom, "stream": parse_stream, "stream-count": count_stream}
+
+
+def run_one(impl, n_entries, repeat):
+    cont = synthetic.make_feed(n_entries)
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    t = time.perf_counter()
+    for _ in range(repeat):
+        PARSERS[impl](cont)
+    elapsed = time.perf_counter() - t
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(impl, n_entries * repeat / elapsed, peak_rss - base_rss)
+
+
+def main():
+    par = argparse.ArgumentParser(description="Benchmark the atom response parser.")
+    par.add_argument("-e", "--entries", type=int, default=5000, help="entries per feed.")
+    par.add_argument("-r", "--repeat", type=int, default=3, help="times each feed is parsed.")
+    par.add_argument("--impl", choices=sorted(PARSERS), default=None, help=argparse.SUPPRESS)
+    arg = par.parse_args()
+
+    if arg.impl is not None:
+        run_one(arg.impl, arg.entries, arg.repeat)
+        return
+
+    print("feed size: %.1f MB, %d entries" % (len(synthetic.make_feed(arg.entries)) / 2 ** 20, arg.entries))
+    print("{:<14s}{:>14s}{:>16s}".format("parser", "entries/s", "peak rss (MB)"))
+    for impl in ["dom", "stream", "stream-count"]:
+        out = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--impl", impl,
+                                       "-e", str(arg.entries), "-r", str(arg.repeat)], universal_newlines=True)
+        _, rate, rss = out.split()
+        print("{:<14s}{:>14,.0f}{:>16.1f}".format(impl, float(rate), int(rss) / 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""
+    cold-start cost of the command line tool, per subcommand: every command runs in a fresh interpreter with
+    `python -X importtime` with empty cache and data directories, network commands against a local mock server (see
+    mockserver.py).
+
+        python bench/bench_startup.py -o startup.json
+        python bench/bench_startup.py --repeat 10 --check
+
+    startup.<command>.wall:     wall time of the whole command, the fastest run.
+    startup.<command>.imports:  time spent importing modules after interpreter startup (site), the fastest run.
+    startup.<command>.modules:  modules imported after interpreter startup.
+
+    --check exits with status 1 if help, an argument error or a command that stays offline loads an http client or
+    the xml parser.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mockserver import MockServer
+
+
+# modules that only commands going online should load
+HEAVY_MODULES = ["requests", "urllib3", "lxml", "aiohttp", "asyncio"]
+
+# commands that must run without them
+LIGHT_COMMANDS = ["help", "help_download", "usage_error", "show", "query_local"]
+
+
+def commands(tmp):
+    watch_list = os.path.join(tmp, "watch.json")
+    with open(watch_list, "w") as f:
+        json.dump({"bench": {"op": "all", "term": "bench"}}, f)
+
+    return {"help": ["help"],
+            "help_download": ["help", "download"],
+            "usage_error": ["download"],
+            "show": ["show", "-d", tmp, "1801.00001"],
+            "query_local": ["query", "-l", "all:bench"],
+            "list": ["--no-cache", "list", "-c", "5", "all:bench"],
+            "download_meta": ["--no-cache", "download", "-m", "-o", os.path.join(tmp, "out"), "1801.00001"],
+            "sync": ["sync", "-c", "5", "--state", os.path.join(tmp, "sync.json"), watch_list]}
+
+
+def parse_importtime(stderr):
+    """
+        :return: (seconds spent importing after interpreter startup, names of the modules imported after it)
+    """
+    total, names = 0, []
+    after_site = False
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue
+
+        top_level = not name[1:].startswith(" ")
+        name = name.strip()
+        if after_site:
+            names.append(name)
+            if top_level:
+                total += int(cumulative) / 1e6
+        elif top_level and name == "site":
+            after_site = True
+
+    return total, names
+
+
+def run(argv, env):
+    t = time.perf_counter()
+    p = subprocess.run([sys.executable, "-X", "importtime", os.path.join(ROOT, "arxiv.py")] + argv, env=env,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    wall = time.perf_counter() - t
+    imports, names = parse_importtime(p.stderr)
+    return wall, imports, names
+
+
+def bench_startup(arg, results):
+    heavy_loaded = {}
+
+    with MockServer(total=100) as server, tempfile.TemporaryDirectory() as tmp:
+        n_runs = 0
+        for name, argv in commands(tmp).items():
+            runs = []
+            for _ in range(arg.repeat):
+                # directories of its own, the rate limit state of the previous run would delay the next one
+                n_runs += 1
+                env = dict(os.environ, PYXIV_API_URL=server.api_url,
+                           XDG_CACHE_HOME=os.path.join(tmp, "cache%d" % n_runs),
+                           XDG_DATA_HOME=os.path.join(tmp, "data%d" % n_runs))
+                runs.append(run(argv, env))
+            names = runs[-1][2]
+
+            results.append(metric("startup.%s.wall" % name, min(r[0] for r in runs) * 1000, "ms"))
+            results.append(metric("startup.%s.imports" % name, min(r[1] for r in runs) * 1000, "ms"))
+            results.append(metric("startup.%s.modules" % name, len(names), "modules"))
+            heavy_loaded[name] = [m for m in HEAVY_MODULES if m in names]
+
+    return heavy_loaded
+
+
+def metric(name, value, unit):
+    return {"name": name, "value": round(value, 4), "unit": unit}
+
+
+def main():
+    par = argparse.ArgumentParser(description="Benchmark the startup time of each arxiv.py subcommand.")
+    par.add_argument("-o", "--output", type=str, default=None, help="write results to this file instead of stdout.")
+    par.add_argument("--repeat", type=int, default=5, help="runs of every command, the fastest is reported.")
+    par.add_argument("--check", default=False, action="store_true",
+                     help="fail if an offline command imports %s." % ", ".join(HEAVY_MODULES))
+    arg = par.parse_args()
+
+    results = []
+    heavy_loaded = bench_startup(arg, results)
+
+    doc = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+           "params": vars(arg), "results": results, "heavy_modules": heavy_loaded}
+    s = json.dumps(doc, indent=2)
+
+    if arg.output is None:
+        print(s)
+    else:
+        with open(arg.output, "w") as f:
+            f.write(s + "\n")
+        for r in results:
+            print("{:<34s}{:>14,.2f} {}".format(r["name"], r["value"], r["unit"]))
+
+    failed = [name for name in LIGHT_COMMANDS if heavy_loaded.get(name)]
+    if arg.check and len(failed) > 0:
+        for name in failed:
+            print("%s imports %s" % (name, ", ".join(heavy_loaded[name])), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""
+    benchmarks of the hot paths against a local mock server (see mockserver.py), results are written as json so they
+    can be compared between revisions:
+
+        python bench/bench_suite.py -o results.json
+        python bench/bench_suite.py --latency 0.1 --error-rate 0.02 --only download
+
+    query:     do_query round trips, and parse_response throughput on the same responses.
+    download:  end-to-end `arxiv.py download` of a batch of IDs in a subprocess (resolve, metadata, transfers).
+    chunk:     time download_file spends per 128k chunk on top of reading the response body.
+    import:    `arxiv.py import` of a gzipped json lines snapshot in a subprocess, with one worker and with --import-jobs.
+
+    the response cache and the local index are disabled in-process, the subprocess gets temporary cache and data
+    directories.
+"""
+
+import argparse
+import gzip
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import const
+import localdb
+import utils
+import xivapi
+import synthetic
+from mockserver import MockServer
+
+
+def bench_query(arg, results):
+    with MockServer(total=arg.pages * arg.page_size, latency=arg.latency, error_rate=arg.error_rate) as server:
+        const.API_URL = server.api_url
+
+        times, bodies, failed = [], [], 0
+        for page in range(arg.pages):
+            url = xivapi.query_url(search_query="all:bench", start=page * arg.page_size, max_results=arg.page_size)
+            t = time.perf_counter()
+            resp, cont = xivapi.load_stream(url)
+            if resp["status"] == "200":
+                xivapi.parse_response(cont, False)
+                bodies.append(cont)
+            else:
+                failed += 1
+            times.append(time.perf_counter() - t)
+
+    t = time.perf_counter()
+    n_entries = sum(len(xivapi.parse_response(cont, False).entries) for cont in bodies)
+    parse_time = time.perf_counter() - t
+
+    results.append(metric("query.request_p50", statistics.median(times) * 1000, "ms"))
+    results.append(metric("query.request_max", max(times) * 1000, "ms"))
+    results.append(metric("query.failed", failed, "requests"))
+    results.append(metric("query.parse_throughput", n_entries / parse_time if parse_time > 0 else 0, "entries/s"))
+    results.append(metric("query.parse_bytes", sum(len(c) for c in bodies) / parse_time / 2 ** 20, "MiB/s"))
+
+
+def bench_download(arg, results):
+    ids = [synthetic.article_id(n) for n in range(arg.articles)]
+
+    with MockServer(pdf_size=arg.pdf_size, latency=arg.latency, error_rate=arg.error_rate) as server, \
+            tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, PYXIV_API_URL=server.api_url,
+                   XDG_CACHE_HOME=os.path.join(tmp, "cache"), XDG_DATA_HOME=os.path.join(tmp, "data"))
+        out = os.path.join(tmp, "out")
+        os.makedirs(out)
+
+        cmd = [sys.executable, os.path.join(ROOT, "arxiv.py"), "--no-cache", "download", "-o", out,
+               "-j", str(arg.jobs), "-r", "1000"] + ids
+        t = time.perf_counter()
+        subprocess.run(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - t
+
+        n_done = len([f for f in os.listdir(out) if f.endswith(".pdf")])
+
+    results.append(metric("download.batch_time", elapsed, "s"))
+    results.append(metric("download.articles_per_second", n_done / elapsed, "articles/s"))
+    results.append(metric("download.throughput", n_done * arg.pdf_size / elapsed / 2 ** 20, "MiB/s"))
+    results.append(metric("download.completed", n_done, "articles"))
+
+
+def bench_chunk(arg, results):
+    chunk_size = 1024 * 128
+    raw_times, file_times = [], []
+
+    with MockServer(pdf_size=arg.chunk_file_size) as server, tempfile.TemporaryDirectory() as tmp:
+        url = server.base + "/pdf/1801.00001"
+        for i in range(arg.repeat):
+            t = time.perf_counter()
+            r = utils.http_get(url, headers={"Accept-Encoding": "identity"}, stream=True)
+            for _ in r.iter_content(chunk_size=chunk_size):
+                pass
+            raw_times.append(time.perf_counter() - t)
+
+            t = time.perf_counter()
+            utils.download_file(url, os.path.join(tmp, "%d.pdf" % i), const.USER_AGENT, show_progress=False)
+            file_times.append(time.perf_counter() - t)
+
+    n_chunks = (arg.chunk_file_size + chunk_size - 1) // chunk_size
+    results.append(metric("chunk.read_time", min(raw_times) / n_chunks * 1e6, "us/chunk"))
+    results.append(metric("chunk.download_file_time", min(file_times) / n_chunks * 1e6, "us/chunk"))
+    results.append(metric("chunk.overhead", (min(file_times) - min(raw_times)) / n_chunks * 1e6, "us/chunk"))
+
+
+def bench_import(arg, results):
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot = os.path.join(tmp, "snapshot.jsonl.gz")
+        with gzip.open(snapshot, "wb", compresslevel=1) as f:
+            for n in range(arg.snapshot_size):
+                f.write(synthetic.make_snapshot_line(n))
+
+        for jobs in sorted({1, arg.import_jobs}):
+            env = dict(os.environ, XDG_CACHE_HOME=os.path.join(tmp, "cache%d" % jobs),
+                       XDG_DATA_HOME=os.path.join(tmp, "data%d" % jobs))
+            cmd = [sys.executable, os.path.join(ROOT, "arxiv.py"), "--no-daemon", "import", "-j", str(jobs),
+                   "-o", os.path.join(tmp, "out%d" % jobs), snapshot]
+            t = time.perf_counter()
+            subprocess.run(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            elapsed = time.perf_counter() - t
+            results.append(metric("import.j%d.throughput" % jobs, arg.snapshot_size / elapsed, "entries/s"))
+
+    # the largest process of all runs, main process or worker
+    results.append(metric("import.peak_rss", resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, "MiB"))
+
+
+def metric(name, value, unit):
+    return {"name": name, "value": round(value, 4), "unit": unit}
+
+
+BENCHMARKS = {"query": bench_query, "download": bench_download, "chunk": bench_chunk, "import": bench_import}
+
+
+def main():
+    par = argparse.ArgumentParser(description="Benchmark pyXiv against a local mock arXiv server.")
+    par.add_argument("-o", "--output", type=str, default=None, help="write results to this file instead of stdout.")
+    par.add_argument("--only", choices=sorted(BENCHMARKS), action="append", help="run only these benchmarks.")
+    par.add_argument("--latency", type=float, default=0.0, help="seconds the server delays every request.")
+    par.add_argument("--error-rate", type=float, default=0.0, help="probability of a 503 response.")
+    par.add_argument("--pages", type=int, default=20, help="query: pages requested.")
+    par.add_argument("--page-size", type=int, default=100, help="query: entries per page.")
+    par.add_argument("--articles", type=int, default=20, help="download: articles in the batch.")
+    par.add_argument("--pdf-size", type=int, default=512 * 1024, help="download: bytes per pdf.")
+    par.add_argument("-j", "--jobs", type=int, default=4, help="download: concurrent transfers.")
+    par.add_argument("--chunk-file-size", type=int, default=64 * 1024 * 1024, help="chunk: bytes transferred.")
+    par.add_argument("--repeat", type=int, default=3, help="chunk: runs, the fastest is reported.")
+    par.add_argument("--snapshot-size", type=int, default=100000, help="import: lines of the snapshot.")
+    par.add_argument("--import-jobs", type=int, default=os.cpu_count() or 1, help="import: worker processes.")
+    arg = par.parse_args()
+
+    xivapi.response_cache.enabled = False
+    localdb.index.enabled = False
+
+    results = []
+    for name in arg.only or sorted(BENCHMARKS):
+        BENCHMARKS[name](arg, results)
+
+    doc = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+           "params": vars(arg), "results": results}
+    s = json.dumps(doc, indent=2)
+
+    if arg.output is None:
+        print(s)
+    else:
+        with open(arg.output, "w") as f:
+            f.write(s + "\n")
+        for r in results:
+            print("{:<34s}{:>14,.2f} {}".format(r["name"], r["value"], r["unit"]))
+
+
+if __name__ == '__main__':
+    main()
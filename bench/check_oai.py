@@ -0,0 +1,143 @@
+"""
+    resume and restart of OAI-PMH harvests (oaipmh.harvest) against the OAI endpoint of the mock server (see
+    mockserver.py), exits with status 1 if a harvest loses, duplicates or garbles records:
+
+        python bench/check_oai.py
+        python bench/check_oai.py --records 5000 --page-size 200
+
+    complete:     a harvest in one go.
+    interrupted:  the server fails with 500 after a few pages and a torn page is left in the output, the harvest is
+                  run again and resumes from its checkpoint.
+    expired:      the resumption token expires mid-harvest (badResumptionToken), the harvest starts over.
+    expired_resume: the token expires while the harvest is interrupted, and the restarted harvest is interrupted
+                  again before it completes.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import localdb
+import oaipmh
+import synthetic
+from mockserver import MockServer
+
+
+def read_output(output):
+    """
+        :return: list of (identifier, datestamp) of the records in output, None if a line is not a record.
+    """
+    records = []
+    with open(output, "rb") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+                records.append((rec["identifier"], rec["datestamp"]))
+            except (ValueError, KeyError):
+                return None
+    return records
+
+
+def harvest(server, output, from_date, on_page=None):
+    try:
+        oaipmh.harvest(output, from_date=from_date, base_url=server.oai_url, delay=0, on_page=on_page)
+        return True
+    except oaipmh.OAIError:
+        return False
+
+
+def after_pages(n, action):
+    # on_page callback that runs action once, after the n-th page of this call
+    pages = [0]
+
+    def on_page(state):
+        pages[0] += 1
+        if pages[0] == n:
+            action()
+    return on_page
+
+
+def check_complete(server, output, from_date):
+    return [harvest(server, output, from_date)]
+
+
+def check_interrupted(server, output, from_date):
+    def fail():
+        server.oai_failures = 1
+
+    first = harvest(server, output, from_date, after_pages(3, fail))
+    with open(output, "ab") as f:
+        # a page cut short by the interruption
+        f.write(b'{"identifier": "oai:arXiv.org:torn", "datest')
+    return [not first, harvest(server, output, from_date)]
+
+
+def check_expired(server, output, from_date):
+    return [harvest(server, output, from_date, after_pages(3, server.expire_tokens))]
+
+
+def check_expired_resume(server, output, from_date):
+    def fail():
+        server.oai_failures = 1
+
+    first = harvest(server, output, from_date, after_pages(2, fail))
+    server.expire_tokens()
+    # the restarted harvest skips the records written so far, its pages are only counted from there
+    second = harvest(server, output, from_date, after_pages(1, fail))
+    return [not first, not second, harvest(server, output, from_date)]
+
+
+CHECKS = {"complete": check_complete, "interrupted": check_interrupted, "expired": check_expired,
+          "expired_resume": check_expired_resume}
+
+
+def main():
+    par = argparse.ArgumentParser(description="Check resume and restart of OAI-PMH harvests against a mock server.")
+    par.add_argument("--records", type=int, default=1000, help="records served by the mock server.")
+    par.add_argument("--page-size", type=int, default=100, help="records per page.")
+    par.add_argument("--from", dest="from_date", type=str, default="2018-03-01",
+                     help="harvest records with datestamps on or after this date.")
+    arg = par.parse_args()
+
+    localdb.index.enabled = False
+
+    expected = sorted(("oai:arXiv.org:" + synthetic.article_id(n), synthetic.oai_datestamp(n))
+                      for n in range(arg.records) if synthetic.oai_datestamp(n) >= arg.from_date)
+
+    failed = []
+    for name, check in CHECKS.items():
+        with MockServer(oai_total=arg.records, oai_page_size=arg.page_size) as server, \
+                tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "records.jsonl")
+            steps = check(server, output, arg.from_date)
+            records = read_output(output)
+
+            problems = []
+            if not all(steps):
+                problems.append("harvest steps: %s" % steps)
+            if records is None:
+                problems.append("output has lines that are not records")
+            else:
+                if len(records) != len(set(records)):
+                    problems.append("%d duplicate records" % (len(records) - len(set(records))))
+                missing = set(expected) - set(records)
+                if len(missing) > 0:
+                    problems.append("%d records missing" % len(missing))
+            if os.path.exists(output + ".checkpoint"):
+                problems.append("checkpoint left behind")
+
+        print("{:<16s}{}".format(name, "; ".join(problems) if problems else "ok"))
+        if problems:
+            failed.append(name)
+
+    if len(failed) > 0:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
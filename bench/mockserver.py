@@ -0,0 +1,275 @@
+"""
+    local stand-in for the arXiv api and pdf server, serving synthetic feeds (see synthetic.py) and pdf bodies.
+
+        python bench/mockserver.py --port 8765 --total 50000 --pdf-size 2000000 --latency 0.05 --error-rate 0.01
+        PYXIV_API_URL=http://127.0.0.1:8765/api/query python arxiv.py download 1801.00001
+
+    /api/query answers id_list and search_query requests (any search matches all --total articles, sortOrder
+    descending lists the newest, highest numbered ones first), pdf links in the feeds point back to /pdf/<id>, which
+    supports Range and If-Range requests. responses carry an ETag and Last-Modified and conditional requests get 304 Not Modified.
+    every request is delayed by --latency seconds and fails with 503 (Retry-After: 0) with probability --error-rate.
+
+    /oai answers ListRecords requests (arXiv metadata format) for --oai-total articles in pages of --oai-page-size,
+    followed by resumptionToken, with datestamps out of article order (see synthetic.oai_datestamp) and from / until
+    applied to them. expire_tokens() makes every token issued so far a badResumptionToken, oai_failures is the number
+    of coming /oai requests answered with 500, to test interrupted and restarted harvests.
+
+        PYXIV_OAI_URL=http://127.0.0.1:8765/oai python arxiv.py oai records -o records.jsonl
+"""
+
+import argparse
+import hashlib
+import http.server
+import os
+import random
+import re
+import sys
+import threading
+import time
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic
+
+
+_REG_ID = re.compile(r"^18([0-9]{2})\.([0-9]{5})(v[0-9]+)?$")
+
+_LAST_MODIFIED = "Mon, 16 Jul 2018 00:00:00 GMT"
+
+
+def article_number(arxiv_id):
+    """
+        :return: the synthetic article number of an ID made by synthetic.article_id, or None.
+    """
+    m = _REG_ID.match(arxiv_id)
+    if m is None or not 1 <= int(m.group(1)) <= 12:
+        return None
+    return (int(m.group(1)) - 1) * 100000 + int(m.group(2))
+
+
+class MockServer:
+    """
+        threaded http server in the background of the current process.
+
+        :param total: number of articles matched by a search.
+        :param pdf_size: bytes of every pdf body.
+        :param latency: seconds every request is delayed.
+        :param error_rate: probability of a 503 response.
+        :param oai_total: number of records of a harvest.
+        :param oai_page_size: records per OAI-PMH page.
+    """
+
+    def __init__(self, port=0, total=10000, pdf_size=1024 * 1024, latency=0.0, error_rate=0.0, seed=0,
+                 oai_total=1000, oai_page_size=100):
+        self.total = total
+        self.oai_total = oai_total
+        self.oai_page_size = oai_page_size
+        self.oai_generation = 0
+        self.oai_failures = 0
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"api": 0, "pdf": 0, "oai": 0, "errors": 0, "bytes": 0, "not_modified": 0}
+        self.pdf = (b"%PDF-1.4\n" + bytes(range(256)) * (pdf_size // 256 + 1))[:pdf_size]
+
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.base = "http://127.0.0.1:%d" % self.port
+        self.api_url = self.base + "/api/query"
+        self.oai_url = self.base + "/oai"
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def feed(self, query):
+        if "id_list" in query:
+            numbers = [article_number(i) for i in query["id_list"][0].split(",")]
+            numbers = [n for n in numbers if n is not None]
+            return synthetic.make_feed(len(numbers), total=len(numbers), pdf_base=self.base, numbers=numbers)
+
+        start = int(query.get("start", ["0"])[0])
+        count = max(0, min(int(query.get("max_results", ["10"])[0]), self.total - start))
+        numbers = None
+        if query.get("sortOrder") == ["descending"]:
+            # newest articles (highest numbers) first
+            numbers = range(self.total - 1 - start, self.total - 1 - start - count, -1)
+        return synthetic.make_feed(count, start=start, total=self.total, pdf_base=self.base, numbers=numbers)
+
+    def expire_tokens(self):
+        with self.lock:
+            self.oai_generation += 1
+
+    def oai_page(self, query):
+        """
+            :return: (status, body) of an OAI-PMH request.
+        """
+        with self.lock:
+            if self.oai_failures > 0:
+                self.oai_failures -= 1
+                self.stats["errors"] += 1
+                return 500, b""
+            generation = self.oai_generation
+
+        if query.get("verb") != ["ListRecords"]:
+            return 200, synthetic.make_oai_error("badVerb", "only ListRecords is served")
+
+        if "resumptionToken" in query:
+            # generation/offset/from/until
+            parts = query["resumptionToken"][0].split("/")
+            if len(parts) != 4 or parts[0] != str(generation):
+                return 200, synthetic.make_oai_error("badResumptionToken", "expired")
+            offset, from_date, until = int(parts[1]), parts[2], parts[3]
+        else:
+            offset, from_date, until = 0, query.get("from", [""])[0], query.get("until", [""])[0]
+
+        numbers = [n for n in range(self.oai_total)
+                   if from_date <= synthetic.oai_datestamp(n) and (until == "" or synthetic.oai_datestamp(n) <= until)]
+        if len(numbers) == 0:
+            return 200, synthetic.make_oai_error("noRecordsMatch")
+
+        page = numbers[offset:offset + self.oai_page_size]
+        token = None
+        if offset + len(page) < len(numbers):
+            token = "%d/%d/%s/%s" % (generation, offset + len(page), from_date, until)
+        return 200, synthetic.make_oai_page(page, token, cursor=offset, total=len(numbers))
+
+    def _fail(self):
+        with self.lock:
+            fail = self.random.random() < self.error_rate
+            if fail:
+                self.stats["errors"] += 1
+        return fail
+
+    def _count(self, kind, n_bytes):
+        with self.lock:
+            self.stats[kind] += 1
+            self.stats["bytes"] += n_bytes
+
+    def _handler(self):
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                if server.latency > 0:
+                    time.sleep(server.latency)
+
+                if server._fail():
+                    self.send_response(503)
+                    self.send_header("Retry-After", "0")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                url = urlparse(self.path)
+                if url.path.startswith("/pdf/"):
+                    self.send_pdf()
+                elif url.path == "/oai":
+                    status, body = server.oai_page(parse_qs(url.query))
+                    server._count("oai", len(body))
+                    self.send_body(status, body, "text/xml")
+                elif url.path == "/api/query":
+                    body = server.feed(parse_qs(url.query))
+                    if self.not_modified(body):
+                        return
+                    server._count("api", len(body))
+                    self.send_body(200, body, "application/atom+xml", self.validators(body))
+                else:
+                    self.send_body(404, b"", "text/plain")
+
+            def validators(self, body):
+                return {"ETag": '"%s"' % hashlib.sha1(body).hexdigest(), "Last-Modified": _LAST_MODIFIED}
+
+            def not_modified(self, body):
+                # answer a conditional request whose copy is current, If-None-Match takes precedence
+                headers = self.validators(body)
+                if "If-None-Match" in self.headers:
+                    current = self.headers["If-None-Match"] == headers["ETag"]
+                else:
+                    current = self.headers.get("If-Modified-Since") == headers["Last-Modified"]
+                if not current:
+                    return False
+                with server.lock:
+                    server.stats["not_modified"] += 1
+                self.send_body(304, b"", None, headers)
+                return True
+
+            def send_pdf(self):
+                body = server.pdf
+                if self.not_modified(body):
+                    return
+                status = 200
+                headers = self.validators(body)
+
+                m = re.match(r"^bytes=([0-9]+)-$", self.headers.get("Range", ""))
+                if m is not None and self.headers.get("If-Range", headers["ETag"]) not in headers.values():
+                    # the client holds part of another revision, it gets the whole document
+                    m = None
+                if m is not None:
+                    first = int(m.group(1))
+                    if first >= len(body):
+                        self.send_body(416, b"", "application/pdf", {"Content-Range": "bytes */%d" % len(body)})
+                        return
+                    status = 206
+                    headers["Content-Range"] = "bytes %d-%d/%d" % (first, len(body) - 1, len(body))
+                    body = body[first:]
+
+                server._count("pdf", len(body))
+                self.send_body(status, body, "application/pdf", headers)
+
+            def send_body(self, status, body, content_type, headers=None):
+                self.send_response(status)
+                if content_type is not None:
+                    self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    par = argparse.ArgumentParser(description="Serve synthetic arXiv api responses and pdf bodies.")
+    par.add_argument("-p", "--port", type=int, default=8765, help="port to listen on (127.0.0.1).")
+    par.add_argument("-t", "--total", type=int, default=10000, help="articles matched by a search.")
+    par.add_argument("-s", "--pdf-size", type=int, default=1024 * 1024, help="bytes of every pdf.")
+    par.add_argument("-l", "--latency", type=float, default=0.0, help="seconds every request is delayed.")
+    par.add_argument("-e", "--error-rate", type=float, default=0.0, help="probability of a 503 response.")
+    par.add_argument("--oai-total", type=int, default=1000, help="records of an OAI-PMH harvest.")
+    par.add_argument("--oai-page-size", type=int, default=100, help="records per OAI-PMH page.")
+    arg = par.parse_args()
+
+    server = MockServer(port=arg.port, total=arg.total, pdf_size=arg.pdf_size, latency=arg.latency,
+                        error_rate=arg.error_rate, oai_total=arg.oai_total, oai_page_size=arg.oai_page_size)
+    print("serving on", server.api_url)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+    synthetic arXiv api responses, OAI-PMH pages and metadata snapshot lines for benchmarks.
+"""
+
+import json
+import time
+
+_FEED_HEAD = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+              '<feed xmlns="http://www.w3.org/2005/Atom">\n'
+              '  <link href="http://arxiv.org/api/query" rel="self" type="application/atom+xml"/>\n'
+              '  <title type="html">ArXiv Query: synthetic</title>\n'
+              '  <id>http://arxiv.org/api/synthetic</id>\n'
+              '  <updated>2018-07-16T00:00:00-04:00</updated>\n'
+              '  <opensearch:totalResults xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/">{total}</opensearch:totalResults>\n'
+              '  <opensearch:startIndex xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/">{start}</opensearch:startIndex>\n'
+              '  <opensearch:itemsPerPage xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/">{count}</opensearch:itemsPerPage>\n')
+
+_ENTRY = ('  <entry>\n'
+          '    <id>http://arxiv.org/abs/{id}v{version}</id>\n'
+          '    <updated>{date}</updated>\n'
+          '    <published>{date}</published>\n'
+          '    <title>Synthetic article {id}: a study of {words}</title>\n'
+          '    <summary>  {summary}\n</summary>\n'
+          '    <author>\n      <name>Alice Author {n}</name>\n    </author>\n'
+          '    <author>\n      <name>Bob Author</name>\n    </author>\n'
+          '    <arxiv:comment xmlns:arxiv="http://arxiv.org/schemas/atom">10 pages, 4 figures</arxiv:comment>\n'
+          '    <link href="http://arxiv.org/abs/{id}v{version}" rel="alternate" type="text/html"/>\n'
+          '    <link title="pdf" href="{pdf_base}/pdf/{id}v{version}" rel="related" type="application/pdf"/>\n'
+          '    <arxiv:primary_category xmlns:arxiv="http://arxiv.org/schemas/atom" term="{category}" '
+          'scheme="http://arxiv.org/schemas/atom"/>\n'
+          '    <category term="{category}" scheme="http://arxiv.org/schemas/atom"/>\n'
+          '  </entry>\n')
+
+_OAI_HEAD = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+             '<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">\n'
+             '  <responseDate>2018-07-16T00:00:00Z</responseDate>\n'
+             '  <request verb="ListRecords" metadataPrefix="arXiv">http://export.arxiv.org/oai2</request>\n'
+             '  <ListRecords>\n')
+
+_OAI_RECORD = ('    <record>\n'
+               '      <header>\n'
+               '        <identifier>oai:arXiv.org:{id}</identifier>\n'
+               '        <datestamp>{datestamp}</datestamp>\n'
+               '        <setSpec>cs</setSpec>\n'
+               '      </header>\n'
+               '      <metadata>\n'
+               '        <arXiv xmlns="http://arxiv.org/OAI/arXiv/">\n'
+               '          <id>{id}</id>\n'
+               '          <created>{created}</created>\n'
+               '          <authors><author><keyname>Author</keyname><forenames>Alice</forenames></author></authors>\n'
+               '          <title>Synthetic article {id}: a study of {words}</title>\n'
+               '          <categories>{category}</categories>\n'
+               '          <abstract>{summary}</abstract>\n'
+               '        </arXiv>\n'
+               '      </metadata>\n'
+               '    </record>\n')
+
+_WORDS = "efficient inference engine sparse neural network accelerator quantum field lattice gauge theory".split()
+_CATEGORIES = ["cs.AR", "cs.LG", "hep-th", "math.CO", "q-bio.NC"]
+
+
+def article_id(n):
+    return "18%02d.%05d" % (n // 100000 % 12 + 1, n % 100000)
+
+
+def make_entry(n, pdf_base="http://arxiv.org"):
+    words = " ".join(_WORDS[(n + i) % len(_WORDS)] for i in range(4))
+    # article n is submitted ten minutes after article n - 1
+    date = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(1514764800 + n * 600))
+    return _ENTRY.format(id=article_id(n), version=n % 3 + 1, date=date, words=words, n=n,
+                         summary=(words + ". ") * 20, category=_CATEGORIES[n % len(_CATEGORIES)], pdf_base=pdf_base)
+
+
+def make_snapshot_line(n):
+    """
+        :return: article n as a line of the arXiv metadata snapshot (json lines, see importer.snapshot_record), in bytes.
+    """
+    words = " ".join(_WORDS[(n + i) % len(_WORDS)] for i in range(4))
+    versions = [{"version": "v%d" % (v + 1), "created": time.strftime("%a, %d %b %Y %H:%M:%S GMT",
+                                                                       time.gmtime(1514764800 + n * 600 + v * 86400))}
+                for v in range(n % 3 + 1)]
+    doc = {"id": article_id(n), "submitter": "Alice Author %d" % n,
+           "authors": "Alice Author %d and Bob Author" % n, "title": "Synthetic article %s: a study of %s" % (article_id(n), words),
+           "comments": "10 pages, 4 figures", "categories": _CATEGORIES[n % len(_CATEGORIES)],
+           "abstract": "  " + (words + ". ") * 20 + "\n", "versions": versions,
+           "update_date": time.strftime("%Y-%m-%d", time.gmtime(1514764800 + n * 600)),
+           "authors_parsed": [["Author %d" % n, "Alice", ""], ["Author", "Bob", ""]]}
+    return json.dumps(doc).encode("utf8") + b"\n"
+
+
+def oai_datestamp(n):
+    """
+        :return: datestamp of article n in OAI-PMH records, in 2018 and not in the order of the articles, like the
+            datestamps of a real repository.
+    """
+    return time.strftime("%Y-%m-%d", time.gmtime(1514764800 + (n * 7919) % 365 * 86400))
+
+
+def make_oai_page(numbers, token=None, cursor=0, total=None):
+    """
+        :param numbers: article numbers of the records on the page, in order.
+        :param token: resumption token of the next page, None on the last page.
+    :return: a ListRecords response (arXiv metadata format) in bytes.
+    """
+    parts = [_OAI_HEAD]
+    for n in numbers:
+        words = " ".join(_WORDS[(n + i) % len(_WORDS)] for i in range(4))
+        parts.append(_OAI_RECORD.format(id=article_id(n), datestamp=oai_datestamp(n), words=words,
+                                        created=time.strftime("%Y-%m-%d", time.gmtime(1514764800 + n * 600)),
+                                        category=_CATEGORIES[n % len(_CATEGORIES)], summary=(words + ". ") * 5))
+    parts.append('    <resumptionToken cursor="%d" completeListSize="%d">%s</resumptionToken>\n'
+                 % (cursor, total if total is not None else cursor + len(numbers), token or ""))
+    parts.append("  </ListRecords>\n</OAI-PMH>\n")
+    return "".join(parts).encode("utf8")
+
+
+def make_oai_error(code, message=""):
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">\n'
+            '  <responseDate>2018-07-16T00:00:00Z</responseDate>\n'
+            '  <error code="%s">%s</error>\n</OAI-PMH>\n' % (code, message)).encode("utf8")
+
+
+def make_feed(count, start=0, total=None, pdf_base="http://arxiv.org", numbers=None):
+    """
+        :param count: number of entries in the feed.
+        :param start: index of the first entry.
+        :param total: value of opensearch:totalResults, defaults to start + count.
+        :param numbers: explicit list of article numbers to include instead of start..start+count, in order.
+    :return: the feed in bytes.
+    """
+    if numbers is None:
+        numbers = range(start, start + count)
+    if total is None:
+        total = start + count
+
+    parts = [_FEED_HEAD.format(total=total, start=start, count=len(numbers))]
+    parts.extend(make_entry(n, pdf_base) for n in numbers)
+    parts.append("</feed>\n")
+    return "".join(parts).encode("utf8")
@@ -0,0 +1,213 @@
+import collections
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import const
+
+
+def normalize_url(url):
+    """
+        normalize a query url so equivalent queries share a cache key: parameters are sorted, empty ones dropped.
+    """
+    parts = urlsplit(url)
+    params = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=False))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, urlencode(params), ""))
+
+
+def query_kind(url):
+    """
+        "id" for pure id_list lookups, "search" for everything else.
+    """
+    keys = [k for k, _ in parse_qsl(urlsplit(url).query)]
+    if "id_list" in keys and "search_query" not in keys:
+        return "id"
+    return "search"
+
+
+class ResponseCache:
+    """
+        on-disk cache of raw api responses, keyed by the normalized query url.
+
+        each response is stored in its own file, the modification time records when it was fetched (for ttl) and the
+        access time when it was last used (for lru eviction once the cache grows over max_size bytes). the etag and
+        last-modified of a response, if it had any, are kept next to it so an expired response can be revalidated.
+
+        :param path: cache directory.
+        :param max_size: size limit of the cache in bytes.
+        :param ttl: dict maps query kind ("id", "search") to seconds a response stays valid.
+    """
+
+    def __init__(self, path=const.CACHE_DIR, max_size=const.CACHE_MAX_SIZE, ttl=None):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl if ttl is not None else dict(const.CACHE_TTL)
+
+        # enabled=False bypasses the cache completely, refresh=True skips lookups but still stores new responses.
+        self.enabled = True
+        self.refresh = False
+
+    def _file(self, url):
+        key = hashlib.sha1(normalize_url(url).encode("utf8")).hexdigest()
+        return os.path.join(self.path, key + ".xml")
+
+    def get(self, url):
+        """
+            :return: the cached response body in bytes, or None if it is missing or expired.
+        """
+        if not self.enabled or self.refresh:
+            return None
+
+        fname = self._file(url)
+        try:
+            st = os.stat(fname)
+        except OSError:
+            return None
+
+        now = time.time()
+        if now - st.st_mtime > self.ttl.get(query_kind(url), 0):
+            return None
+
+        try:
+            with io.open(fname, "rb") as f:
+                content = f.read()
+            os.utime(fname, (now, st.st_mtime))
+        except OSError:
+            return None
+
+        return content
+
+    def stale(self, url):
+        """
+            :return: (content, validators) of an expired response that can be revalidated with a conditional request
+                (see utils.conditional_headers), or None.
+        """
+        if not self.enabled:
+            return None
+
+        fname = self._file(url)
+        try:
+            with io.open(_validators_file(fname), "r", encoding="utf8") as f:
+                validators = json.load(f)
+            with io.open(fname, "rb") as f:
+                content = f.read()
+        except (OSError, ValueError):
+            return None
+
+        return content, validators
+
+    def renew(self, url):
+        """
+            mark a response confirmed by the server (304 Not Modified) as freshly fetched.
+        """
+        try:
+            os.utime(self._file(url))
+        except OSError:
+            pass
+
+    def put(self, url, content, validators=None):
+        """
+            :param validators: dict of the response's "etag" / "last_modified", see utils.response_validators.
+        """
+        if not self.enabled:
+            return
+
+        fname = self._file(url)
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            tmp_name = fname + "." + str(os.getpid()) + ".tmp"
+            with io.open(tmp_name, "wb") as f:
+                f.write(content)
+            os.replace(tmp_name, fname)
+
+            if validators:
+                with io.open(tmp_name, "w", encoding="utf8") as f:
+                    json.dump(validators, f)
+                os.replace(tmp_name, _validators_file(fname))
+            elif os.path.exists(_validators_file(fname)):
+                os.remove(_validators_file(fname))
+        except OSError:
+            return
+
+        self.evict()
+
+    def evict(self):
+        """
+            remove least recently used responses until the cache fits in max_size.
+        """
+        files = []
+        total = 0
+        try:
+            with os.scandir(self.path) as it:
+                for e in it:
+                    if e.name.endswith(".xml"):
+                        st = e.stat()
+                        files.append((st.st_atime, st.st_size, e.path))
+                        total += st.st_size
+        except OSError:
+            return
+
+        files.sort()
+        for _, size, path in files:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                if os.path.exists(_validators_file(path)):
+                    os.remove(_validators_file(path))
+            except OSError:
+                pass
+
+
+class MemoryCache:
+    """
+        parsed responses kept in memory by a long running process (arxiv serve), keyed by the normalized query url.
+        they expire like the responses of ResponseCache, the least recently used ones are dropped beyond max_entries.
+
+        disabled by default, a single command gains nothing from it over the on-disk cache.
+    """
+
+    def __init__(self, max_entries=const.MEMORY_CACHE_ENTRIES, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl if ttl is not None else dict(const.CACHE_TTL)
+        self.enabled = False
+        self.items = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, url):
+        """
+            :return: the cached value, or None if it is missing or expired.
+        """
+        if not self.enabled:
+            return None
+
+        key = normalize_url(url)
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                return None
+            stored, value = item
+            if time.time() - stored > self.ttl.get(query_kind(url), 0):
+                del self.items[key]
+                return None
+            self.items.move_to_end(key)
+            return value
+
+    def put(self, url, value):
+        if not self.enabled:
+            return
+
+        with self.lock:
+            self.items[normalize_url(url)] = (time.time(), value)
+            self.items.move_to_end(normalize_url(url))
+            while len(self.items) > self.max_entries:
+                self.items.popitem(last=False)
+
+
+def _validators_file(fname):
+    return fname[:-len(".xml")] + ".validators.json"
@@ -0,0 +1,229 @@
+import io
+import json
+import os
+import threading
+import zlib
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+import model
+
+
+CATALOG_NAME = "catalog.jsonl"
+
+# file name suffix of each compression
+SUFFIXES = {None: "", "gzip": ".gz", "zstd": ".zst"}
+
+
+class Catalog:
+    """
+        append-only metadata catalog of a download directory: one compact json line per record, the latest record of
+        an ID wins. a record is {"id", "version", "updated", "entry": model.Entry.to_dict(), "file": {...}}.
+
+        records appended together are written as one block, with compression each block is a gzip member or zstd
+        frame of its own, so a block can be read without decompressing the file from its start. the index next to
+        the catalog (catalog.jsonl.idx) maps each ID to the offset of its latest block, it is brought up to date
+        from the catalog if it falls behind.
+
+        :param directory: directory of the catalog.
+        :param compress: None, "gzip" or "zstd" (needs the zstandard package), only used when the catalog is created,
+            an existing catalog keeps its compression.
+    """
+
+    def __init__(self, directory, compress=None):
+        for c, suffix in SUFFIXES.items():
+            if os.path.exists(os.path.join(directory, CATALOG_NAME + suffix)):
+                compress = c
+                break
+
+        if compress not in SUFFIXES:
+            raise ValueError("unsupported compression: " + str(compress))
+        if compress == "zstd" and zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package")
+
+        self.compress = compress
+        self.path = os.path.join(directory, CATALOG_NAME + SUFFIXES[compress])
+        self.index_path = self.path + ".idx"
+        self.offsets = None
+        self.indexed_size = 0
+        self.lock = threading.Lock()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _compress(self, data):
+        if self.compress == "gzip":
+            c = zlib.compressobj(wbits=31)
+            return c.compress(data) + c.flush()
+        if self.compress == "zstd":
+            return zstandard.ZstdCompressor().compress(data)
+        return data
+
+    def _decompressor(self):
+        if self.compress == "gzip":
+            return zlib.decompressobj(wbits=31)
+        return zstandard.ZstdDecompressor().decompressobj()
+
+    def _read_block(self, f, offset):
+        # :return: (lines of the block at offset, offset of the next block)
+        f.seek(offset)
+        if self.compress is None:
+            line = f.readline()
+            return [line], offset + len(line)
+
+        d = self._decompressor()
+        data = []
+        consumed = 0
+        while not d.eof:
+            chunk = f.read(64 * 1024)
+            if not chunk:
+                raise ValueError("truncated block at offset %d of %s" % (offset, self.path))
+            data.append(d.decompress(chunk))
+            consumed += len(chunk)
+        return b"".join(data).splitlines(), offset + consumed - len(d.unused_data)
+
+    def _scan(self, f, offset, end):
+        # :return: (id -> offset of the blocks from offset to end, offset where scanning stopped)
+        found = {}
+        while offset < end:
+            try:
+                lines, next_offset = self._read_block(f, offset)
+                ids = [json.loads(line)["id"] for line in lines if line.strip()]
+            except (ValueError, KeyError, zlib.error):
+                # a block cut short by an interrupted write, it is overwritten by the next append
+                break
+            for i in ids:
+                found[i] = offset
+            offset = next_offset
+        return found, offset
+
+    def _load_index(self):
+        # read the index, and index blocks appended after it was last written
+        if self.offsets is not None and self.indexed_size == self._size():
+            return
+
+        offsets, size = {}, 0
+        rebuild = not os.path.exists(self.index_path)
+        if not rebuild:
+            with io.open(self.index_path, "r", encoding="utf8") as f:
+                for line in f:
+                    key, _, value = line.rstrip("\n").rpartition("\t")
+                    if key == "#size":
+                        size = int(value)
+                    elif key != "":
+                        offsets[key] = int(value)
+
+        end = self._size()
+        if size > end:
+            # the catalog is shorter than the index says, index it again
+            offsets, size, rebuild = {}, 0, True
+
+        if size < end:
+            with io.open(self.path, "rb") as f:
+                found, size = self._scan(f, size, end)
+            offsets.update(found)
+            self._write_index(offsets if rebuild else found, size, append=not rebuild)
+
+        self.offsets = offsets
+        self.indexed_size = size
+
+    def _write_index(self, offsets, size, append=True):
+        with io.open(self.index_path, "a" if append else "w", encoding="utf8") as f:
+            f.write("".join("%s\t%d\n" % (k, v) for k, v in offsets.items()) + "#size\t%d\n" % size)
+
+    def _size(self):
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def append(self, records):
+        """
+            append records (dicts with at least "id") as one block.
+        """
+        records = list(records)
+        if len(records) == 0:
+            return
+
+        lines = [json.dumps(r, separators=(",", ":"), ensure_ascii=False).encode("utf8") + b"\n" for r in records]
+
+        with self.lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with io.open(self.path, "ab") as f:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+                self._load_index()
+                # drop a partly written block left by an interrupted append
+                f.truncate(self.indexed_size)
+                f.seek(self.indexed_size)
+
+                offset = f.tell()
+                offsets = {}
+                if self.compress is None:
+                    for r, line in zip(records, lines):
+                        offsets[r["id"]] = offset
+                        offset += len(line)
+                    f.write(b"".join(lines))
+                else:
+                    f.write(self._compress(b"".join(lines)))
+                    offsets = {r["id"]: offset for r in records}
+                f.flush()
+                os.fsync(f.fileno())
+
+                self.indexed_size = f.tell()
+                self.offsets.update(offsets)
+                self._write_index(offsets, self.indexed_size)
+
+    def get(self, arxiv_id):
+        """
+            :return: the latest record of an ID (without version), or None.
+        """
+        with self.lock:
+            if not self.exists():
+                return None
+            self._load_index()
+            offset = self.offsets.get(arxiv_id)
+            if offset is None:
+                return None
+            with io.open(self.path, "rb") as f:
+                lines, _ = self._read_block(f, offset)
+
+        record = None
+        for line in lines:
+            r = json.loads(line)
+            if r["id"] == arxiv_id:
+                record = r
+        return record
+
+    def ids(self):
+        with self.lock:
+            if not self.exists():
+                return []
+            self._load_index()
+            return list(self.offsets)
+
+    def __len__(self):
+        return len(self.ids())
+
+
+def entry_record(entry, file_record=None):
+    """
+        :return: the catalog record of a model.Entry, with the downloaded file's name, size and sha256 if given.
+    """
+    record = {"id": entry.id, "version": entry.version, "updated": entry.updated, "entry": entry.to_dict()}
+    if file_record is not None:
+        record["file"] = file_record
+    return record
+
+
+def record_entry(record):
+    """
+        :return: model.Entry of a catalog record.
+    """
+    return model.Entry.from_dict(record["entry"])
@@ -1,3 +1,4 @@
+import os
 import re
 
 USER_AGENT = "pyXiv(2.0); python 3; Console;"
@@ -7,7 +8,66 @@ xml_namespace = {
     'atom': "http://www.w3.org/2005/Atom"}
 
 oai_namespace = {
+    "oai": "http://www.openarchives.org/OAI/2.0/",
+    "oai_dc": "http://www.openarchives.org/OAI/2.0/oai_dc/",
+    "dc": "http://purl.org/dc/elements/1.1/",
+    "arXiv": "http://arxiv.org/OAI/arXiv/",
+    "arXivRaw": "http://arxiv.org/OAI/arXivRaw/"}
 
-}
+# api endpoints, PYXIV_API_URL / PYXIV_OAI_URL point pyXiv at a mirror or a local mock server
+API_URL = os.environ.get("PYXIV_API_URL", "http://export.arxiv.org/api/query")
+OAI_URL = os.environ.get("PYXIV_OAI_URL", "http://export.arxiv.org/oai2")
 
 REG_IS_ARXIV_ID = re.compile("^([0-9+]{2}[01][0-9]\.[0-9]+(v[0-9]+){0,1})$")
+REG_ID_VERSION = re.compile("^(.+?)(v[0-9]+){0,1}$")
+
+# characters of comma separated IDs sent in a single id_list query, keeps the query url well below 2k.
+MAX_ID_LIST_LENGTH = 1800
+
+# characters of a search_query sent in a single request, longer queries are split into sub-queries, and sub-queries
+# of a split query (or id_list chunks) run concurrently in this many threads, still under the shared api rate limit
+MAX_QUERY_LENGTH = 1800
+PLANNER_JOBS = 4
+
+# shared http client: (connect, read) timeouts in seconds, and connections kept alive per host
+HTTP_TIMEOUT = (10, 60)
+HTTP_POOL_SIZE = 16
+
+# redraws per second of download progress bars
+PROGRESS_FPS = 10
+
+# politeness limit for article downloads, requests per second
+DOWNLOAD_RATE = 1 / 3
+
+# on-disk cache of api responses
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "pyxiv")
+CACHE_MAX_SIZE = 64 * 1024 * 1024
+CACHE_TTL = {"id": 7 * 24 * 3600,
+             "search": 3600}
+
+# api etiquette: seconds between consecutive api requests, and results fetched per request when paging
+API_DELAY = 3
+PAGE_SIZE = 100
+
+# local data: metadata index, harvest state
+DATA_DIR = os.path.join(os.environ.get("XDG_DATA_HOME", os.path.expanduser("~/.local/share")), "pyxiv")
+LOCAL_INDEX = os.path.join(DATA_DIR, "metadata.sqlite")
+
+# minimum trigram similarity (0..1) for a title to be resolved from the local index instead of an api search
+TITLE_MATCH_THRESHOLD = 0.6
+
+# failed api requests (429, 5xx, connection errors) are retried with exponential backoff plus jitter, in seconds
+API_RETRIES = 4
+BACKOFF_BASE = 3
+BACKOFF_MAX = 60
+
+# rate limiter state shared by pyXiv processes on this host
+RATE_STATE_DIR = os.path.join(DATA_DIR, "ratelimit")
+
+# high-water marks of watched queries (arxiv sync), and new entries taken from a query synced for the first time
+SYNC_STATE = os.path.join(DATA_DIR, "sync.json")
+SYNC_INITIAL = 100
+
+# unix socket of the daemon (arxiv serve), and parsed responses it keeps in memory
+SERVE_SOCKET = os.path.join(DATA_DIR, "serve.sock")
+MEMORY_CACHE_ENTRIES = 256
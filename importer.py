@@ -0,0 +1,238 @@
+import bz2
+import gzip
+import io
+import json
+import os
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+import catalog
+import localdb
+import oaipmh
+import xivapi
+
+
+# files picked up from a directory
+SUFFIXES = [".jsonl", ".json", ".xml"]
+COMPRESSED = {".gz": gzip.open, ".bz2": bz2.open}
+
+
+def open_input(filename):
+    """
+        :return: binary file object of filename, decompressed on the fly if it ends with .gz, .bz2 or .zst.
+    """
+    base, ext = os.path.splitext(filename)
+    if ext in COMPRESSED:
+        return COMPRESSED[ext](filename, "rb")
+    if ext == ".zst":
+        if zstandard is None:
+            raise ValueError(filename + ": zstd input needs the zstandard package")
+        return zstandard.ZstdDecompressor().stream_reader(io.open(filename, "rb"), closefd=True)
+    return io.open(filename, "rb")
+
+
+def input_format(filename):
+    """
+        :return: "jsonl", "atom" or "oai", by the first bytes of the file.
+        :raise ValueError: for anything else.
+    """
+    with open_input(filename) as f:
+        head = f.read(4096)
+
+    if head.lstrip()[:1] == b"{" or head.strip() == b"":
+        return "jsonl"
+    if head.lstrip()[:1] == b"<":
+        return "oai" if b"http://www.openarchives.org/OAI/2.0/" in head else "atom"
+    raise ValueError(filename + ": neither json lines nor xml")
+
+
+def list_inputs(paths):
+    """
+        :return: files of paths, directories are walked for json lines and xml files (possibly compressed).
+    """
+    files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            files.append(path)
+            continue
+        for root, _, names in sorted(os.walk(path)):
+            for name in sorted(names):
+                base, ext = os.path.splitext(name)
+                if ext in COMPRESSED or ext == ".zst":
+                    ext = os.path.splitext(base)[1]
+                if ext in SUFFIXES:
+                    files.append(os.path.join(root, name))
+    return files
+
+
+def snapshot_record(doc):
+    """
+        convert a line of the arXiv metadata snapshot (the json lines dump with "versions" and "authors_parsed") into
+        a harvested arXiv record, see oaipmh.to_entry.
+    """
+    versions = []
+    for v in doc.get("versions") or []:
+        versions.append({"@version": v.get("version", ""), "date": _iso_date(v.get("created"))})
+
+    authors = doc.get("authors") or ""
+    if doc.get("authors_parsed"):
+        # [keyname, forenames, suffix]
+        authors = {"author": [{"keyname": " ".join([a[0]] + [p for p in a[2:] if p]),
+                               "forenames": a[1] if len(a) > 1 else ""}
+                              for a in doc["authors_parsed"] if len(a) > 0]}
+
+    metadata = {"id": doc["id"], "title": doc.get("title") or "", "abstract": (doc.get("abstract") or "").strip(),
+                "comments": doc.get("comments") or "", "categories": doc.get("categories") or "",
+                "authors": authors, "version": versions}
+    if len(versions) > 0:
+        metadata["created"] = versions[0]["date"]
+        metadata["updated"] = versions[-1]["date"]
+
+    return {"identifier": "oai:arXiv.org:" + doc["id"], "datestamp": doc.get("update_date"), "metadata": metadata}
+
+
+def _iso_date(date):
+    # "Mon, 2 Apr 2007 19:18:42 GMT" -> "2007-04-02T19:18:42Z", the format of the api
+    if not date:
+        return None
+    import email.utils
+    try:
+        return email.utils.parsedate_to_datetime(date).strftime("%Y-%m-%dT%H:%M:%SZ")
+    except (TypeError, ValueError):
+        return date
+
+
+def json_entry(doc):
+    """
+        :return: model.Entry of a json line: a catalog record or json export of pyXiv, a record harvested by
+            `arxiv oai`, or a line of the arXiv metadata snapshot. None if it is none of them.
+    """
+    if type(doc) is not dict:
+        return None
+    if "entry" in doc:
+        return catalog.record_entry(doc)
+    if "metadata" in doc:
+        return oaipmh.to_entry(doc)
+    if "id" in doc and ("versions" in doc or "abstract" in doc):
+        return oaipmh.to_entry(snapshot_record(doc))
+    return None
+
+
+def parse_lines(lines):
+    """
+        parse a chunk of json lines, runs in a worker process.
+
+    :return: (list of model.Entry, number of lines skipped)
+    """
+    entries, skipped = [], 0
+    for line in lines:
+        if line.strip() == b"":
+            continue
+        try:
+            entry = json_entry(json.loads(line))
+        except (ValueError, KeyError, TypeError, AttributeError, IndexError):
+            entry = None
+        if entry is None:
+            skipped += 1
+        else:
+            entries.append(entry)
+    return entries, skipped
+
+
+def parse_xml(filename, fmt):
+    """
+        parse a saved api (atom) or OAI-PMH response, runs in a worker process.
+
+    :return: (list of model.Entry, number of records skipped)
+    """
+    entries, skipped = [], 0
+    with open_input(filename) as f:
+        if fmt == "atom":
+            entries = list(xivapi.iter_entries(f))
+        else:
+            for rec in oaipmh.iter_page(f):
+                if type(rec) is tuple:
+                    # the resumption token that ends a page
+                    continue
+                entry = oaipmh.to_entry(rec)
+                if entry is None:
+                    skipped += 1
+                else:
+                    entries.append(entry)
+    return entries, skipped
+
+
+def iter_chunks(f, chunk_size):
+    """
+        read json lines from a binary file object in chunks of chunk_size lines.
+    """
+    chunk = []
+    for line in f:
+        chunk.append(line)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+
+def import_files(paths, store=None, index=True, jobs=None, chunk_size=2000, on_batch=None):
+    """
+        import metadata snapshots: json lines dumps and saved api / OAI-PMH xml pages, plain or compressed.
+
+        files are read as a stream and split into chunks (chunk_size lines of json, or a whole xml page) which are
+        parsed by a pool of processes into model.Entry. parsed chunks are written in order, one batch each, to the
+        local index and / or a catalog. at most two chunks per process are in flight, so memory stays bounded
+        whatever the size of the input.
+
+    :param store: catalog.Catalog that receives a record per entry, or None.
+    :param index: save entries to the local index (localdb.index).
+    :param jobs: worker processes, defaults to the number of cpus.
+    :param on_batch: called with (file name, entries written so far, records skipped so far) after each batch.
+    :return: (entries written, records skipped)
+    """
+
+    import concurrent.futures
+
+    jobs = jobs or os.cpu_count() or 1
+    n_written, n_skipped = 0, 0
+
+    def write(filename, result):
+        nonlocal n_written, n_skipped
+        entries, skipped = result
+        n_skipped += skipped
+        if len(entries) > 0:
+            if index:
+                localdb.index.add(entries)
+            if store is not None:
+                store.append(catalog.entry_record(e) for e in entries)
+            n_written += len(entries)
+        if on_batch is not None:
+            on_batch(filename, n_written, n_skipped)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        pending = []
+
+        def submit(filename, fn, *args):
+            # wait for the oldest chunk first, results are written in input order
+            while len(pending) >= 2 * jobs:
+                name, future = pending.pop(0)
+                write(name, future.result())
+            pending.append((filename, pool.submit(fn, *args)))
+
+        for filename in list_inputs(paths):
+            fmt = input_format(filename)
+            if fmt == "jsonl":
+                with open_input(filename) as f:
+                    for chunk in iter_chunks(f, chunk_size):
+                        submit(filename, parse_lines, chunk)
+            else:
+                submit(filename, parse_xml, filename, fmt)
+
+        for name, future in pending:
+            write(name, future.result())
+
+    return n_written, n_skipped
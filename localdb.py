@@ -0,0 +1,362 @@
+import collections
+import json
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+
+import const
+import model
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT UNIQUE NOT NULL,
+    version TEXT,
+    title TEXT,
+    authors TEXT,
+    abstract TEXT,
+    comment TEXT,
+    categories TEXT,
+    published TEXT,
+    updated TEXT,
+    data TEXT);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+    id, title, authors, abstract, comment, categories, content='entries', content_rowid='rowid');
+
+CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN
+    INSERT INTO entries_fts(rowid, id, title, authors, abstract, comment, categories)
+        VALUES (new.rowid, new.id, new.title, new.authors, new.abstract, new.comment, new.categories);
+END;
+
+CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN
+    INSERT INTO entries_fts(entries_fts, rowid, id, title, authors, abstract, comment, categories)
+        VALUES ('delete', old.rowid, old.id, old.title, old.authors, old.abstract, old.comment, old.categories);
+END;
+
+CREATE TABLE IF NOT EXISTS titles (
+    rowid INTEGER PRIMARY KEY,
+    norm TEXT);
+
+CREATE TABLE IF NOT EXISTS title_grams (
+    gram TEXT NOT NULL,
+    rowid INTEGER NOT NULL,
+    PRIMARY KEY (gram, rowid)) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS title_grams_rowid ON title_grams(rowid);
+
+CREATE TABLE IF NOT EXISTS title_gram_df (
+    gram TEXT PRIMARY KEY,
+    n INTEGER NOT NULL) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS titles_ad AFTER DELETE ON entries BEGIN
+    UPDATE title_gram_df SET n = n - 1 WHERE gram IN (SELECT gram FROM title_grams WHERE rowid = old.rowid);
+    DELETE FROM titles WHERE rowid = old.rowid;
+    DELETE FROM title_grams WHERE rowid = old.rowid;
+END;
+
+CREATE TRIGGER IF NOT EXISTS entries_au AFTER UPDATE ON entries BEGIN
+    INSERT INTO entries_fts(entries_fts, rowid, id, title, authors, abstract, comment, categories)
+        VALUES ('delete', old.rowid, old.id, old.title, old.authors, old.abstract, old.comment, old.categories);
+    INSERT INTO entries_fts(rowid, id, title, authors, abstract, comment, categories)
+        VALUES (new.rowid, new.id, new.title, new.authors, new.abstract, new.comment, new.categories);
+END;
+"""
+
+_UPSERT = """
+INSERT INTO entries (id, version, title, authors, abstract, comment, categories, published, updated, data)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(id) DO UPDATE SET
+        version=excluded.version, title=excluded.title, authors=excluded.authors, abstract=excluded.abstract,
+        comment=excluded.comment, categories=excluded.categories, published=excluded.published,
+        updated=excluded.updated, data=excluded.data
+    WHERE entries.updated IS NULL OR excluded.updated >= entries.updated
+"""
+
+# op-tree fields -> full-text columns, fields that are not stored locally search all columns.
+FIELD_COLUMNS = {"ti": "title", "au": "authors", "abs": "abstract", "co": "comment", "cat": "categories", "id": "id"}
+
+
+# trigrams found in more titles than this (a fraction of all titles, but at least _MIN_GRAM_DF_CAP) are not used to
+# look up candidates for a title match.
+_MAX_GRAM_DF_RATIO = 0.05
+_MIN_GRAM_DF_CAP = 1000
+
+
+def normalize_title(title):
+    """
+        case, accents, punctuation and spacing insensitive form of a title.
+    """
+    title = unicodedata.normalize("NFKD", title or "")
+    title = "".join(c if c.isalnum() else " " for c in title if not unicodedata.combining(c))
+    return " ".join(title.lower().split())
+
+
+def trigrams(norm):
+    """
+        :return: set of character trigrams of a normalized title, words are padded so short words count as well.
+    """
+    grams = set()
+    for w in norm.split():
+        w = "  " + w + " "
+        for i in range(len(w) - 2):
+            grams.add(w[i:i + 3])
+    return grams
+
+
+def similarity(grams1, grams2):
+    # jaccard index of two trigram sets
+    if len(grams1) == 0 or len(grams2) == 0:
+        return 0.0
+    common = len(grams1 & grams2)
+    return common / (len(grams1) + len(grams2) - common)
+
+
+def _phrase(word):
+    return '"' + word.replace('"', '""') + '"'
+
+
+def match_expression(op_tree):
+    """
+        translate an op-tree (see: xivapi.get_query_string) into a fts5 MATCH expression.
+
+    :return: the expression, or None if the op-tree is malformed.
+    """
+
+    if type(op_tree) is str:
+        op_tree = {"op": "all", "term": op_tree}
+
+    op = op_tree.get("op", "all").__str__()
+
+    if "term1" in op_tree and "term2" in op_tree and op in ["and", "or", "andnot"]:
+        t1 = match_expression(op_tree["term1"])
+        t2 = match_expression(op_tree["term2"])
+        if t1 is None or t2 is None:
+            return None
+        return "(" + t1 + {"and": " AND ", "or": " OR ", "andnot": " NOT "}[op] + t2 + ")"
+
+    term = op_tree.get("term", op_tree.get("term1"))
+    if term is None:
+        return None
+
+    # a quoted part of the term is one phrase, other words are matched each on their own
+    words = []
+    for phrase, word in re.findall(r'"([^"]*)"|([^\s"]+)', term.__str__()):
+        phrase = " ".join((phrase or word).replace(":", " ").split())
+        if phrase != "":
+            words.append(phrase)
+    if len(words) == 0:
+        return None
+
+    if op in FIELD_COLUMNS:
+        words = [FIELD_COLUMNS[op] + ":" + _phrase(w) for w in words]
+    else:
+        words = [_phrase(w) for w in words]
+
+    return "(" + " AND ".join(words) + ")"
+
+
+class LocalIndex:
+    """
+        sqlite database of every entry pyXiv has parsed, with a fts5 full-text index for offline searches.
+
+        only the latest version of an article is kept. the database is opened on first use. the index is a
+        by-product of queries, if it can not be opened or written it is disabled for the rest of the process and
+        the error kept in error, queries go on without it.
+    """
+
+    def __init__(self, path=const.LOCAL_INDEX):
+        self.path = path
+        self.enabled = True
+        self.error = None
+        self.conn = None
+        self.lock = threading.Lock()
+
+    def _disable(self, error):
+        self.enabled = False
+        self.error = error
+
+    def _connect(self):
+        if self.conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self.conn.executescript(_SCHEMA)
+            with self.conn:
+                # entries saved before titles were indexed
+                self._index_titles(self.conn.execute(
+                    "SELECT rowid, title FROM entries WHERE rowid NOT IN (SELECT rowid FROM titles)").fetchall())
+        return self.conn
+
+    def _index_titles(self, rows):
+        # rows of (rowid, title), the trigrams of a title are only rewritten when its normalized form changed.
+        # the rows are written together and document frequencies once per gram, titles share most of their grams.
+        titles, replaced, grams = [], [], []
+        df = collections.Counter()
+        for rowid, title in rows:
+            norm = normalize_title(title)
+            old = self.conn.execute("SELECT norm FROM titles WHERE rowid = ?", (rowid,)).fetchone()
+            if old is not None and old[0] == norm:
+                continue
+
+            titles.append((rowid, norm))
+            if old is not None:
+                replaced.append((rowid,))
+                df.subtract(trigrams(old[0]))
+            new_grams = trigrams(norm)
+            grams.extend((g, rowid) for g in new_grams)
+            df.update(new_grams)
+
+        if len(titles) == 0:
+            return
+
+        self.conn.executemany("INSERT OR REPLACE INTO titles (rowid, norm) VALUES (?, ?)", titles)
+        self.conn.executemany("DELETE FROM title_grams WHERE rowid = ?", replaced)
+        self.conn.executemany("INSERT INTO title_grams (gram, rowid) VALUES (?, ?)", grams)
+        self.conn.executemany("INSERT INTO title_gram_df (gram, n) VALUES (?, ?) "
+                              "ON CONFLICT(gram) DO UPDATE SET n = n + excluded.n",
+                              [(g, n) for g, n in df.items() if n != 0])
+
+    def add(self, entries):
+        """
+            save entries (model.Entry), newer versions replace older ones.
+        """
+        if not self.enabled:
+            return
+
+        rows = []
+        for e in entries:
+            if e is None:
+                continue
+            rows.append((e.id, e.version, e.title, "\n".join(e.authors), e.summary, e.comment,
+                         " ".join(e.categories or [e.primary_category or ""]), e.published, e.updated,
+                         json.dumps(e.to_dict(), separators=(",", ":"))))
+
+        if len(rows) == 0:
+            return
+
+        with self.lock:
+            try:
+                conn = self._connect()
+                with conn:
+                    conn.executemany(_UPSERT, rows)
+                    # ids are looked up in slices, sqlite limits the number of parameters of a statement
+                    for i in range(0, len(rows), 500):
+                        ids = [r[0] for r in rows[i:i + 500]]
+                        self._index_titles(conn.execute(
+                            "SELECT rowid, title FROM entries WHERE id IN (%s)" % ",".join("?" * len(ids)),
+                            ids).fetchall())
+            except (sqlite3.Error, OSError) as e:
+                # the index is a by-product of queries, a failure here must not fail the query itself.
+                self._disable(e)
+
+    def get(self, arxiv_id):
+        """
+            :return: model.Entry of the given ID (version is ignored), or None.
+        """
+        if not self.enabled:
+            return None
+        with self.lock:
+            try:
+                row = self._connect().execute("SELECT data FROM entries WHERE id = ?",
+                                              (const.REG_ID_VERSION.match(arxiv_id).group(1),)).fetchone()
+            except (sqlite3.Error, OSError) as e:
+                self._disable(e)
+                return None
+        return model.Entry.from_dict(json.loads(row[0])) if row is not None else None
+
+    def search(self, op_tree, start=0, max_results=None):
+        """
+            full-text search with an op-tree, best matches first.
+
+        :return: list of model.Entry
+        """
+        expr = match_expression(op_tree)
+        if expr is None:
+            return []
+
+        sql = "SELECT entries.data FROM entries_fts JOIN entries ON entries.rowid = entries_fts.rowid " \
+              "WHERE entries_fts MATCH ? ORDER BY rank LIMIT ? OFFSET ?"
+
+        with self.lock:
+            rows = self._connect().execute(sql, (expr, -1 if max_results is None else max_results, start)).fetchall()
+
+        return [model.Entry.from_dict(json.loads(r[0])) for r in rows]
+
+    def match_title(self, title, threshold=const.TITLE_MATCH_THRESHOLD, candidates=50):
+        """
+            find the entry whose title is most similar to the given one, by trigram similarity of normalized titles.
+
+        :param threshold: minimum similarity (0..1) of a match, 1 only accepts titles equal after normalization.
+        :param candidates: number of titles sharing the most trigrams that are compared exactly.
+        :return: (model.Entry, similarity) or None if no title is similar enough.
+        """
+        norm = normalize_title(title)
+        grams = trigrams(norm)
+        if len(grams) == 0 or not self.enabled:
+            return None
+
+        with self.lock:
+            try:
+                return self._match_title(norm, grams, threshold, candidates)
+            except (sqlite3.Error, OSError) as e:
+                self._disable(e)
+                return None
+
+    def _match_title(self, norm, grams, threshold, candidates):
+        # :return: (model.Entry, similarity) or None, called with the lock held
+        conn = self._connect()
+
+        # candidates are found with the rarer trigrams only, grams like " th" or "ion" are in most titles and
+        # would make the lookup scan nearly the whole table.
+        df = dict(conn.execute("SELECT gram, n FROM title_gram_df WHERE gram IN (%s) AND n > 0"
+                               % ",".join("?" * len(grams)), list(grams)).fetchall())
+        if len(df) == 0:
+            return None
+
+        n_titles = conn.execute("SELECT max(rowid) FROM titles").fetchone()[0] or 0
+        max_df = max(_MIN_GRAM_DF_CAP, int(n_titles * _MAX_GRAM_DF_RATIO))
+        rare = sorted(df, key=df.get)
+        keys = [g for g in rare if df[g] <= max_df] or rare[:3]
+
+        sql = "SELECT titles.rowid, titles.norm FROM titles JOIN (" \
+              "SELECT rowid, count(*) AS n FROM title_grams WHERE gram IN (%s) GROUP BY rowid " \
+              "ORDER BY n DESC LIMIT ?) AS c ON c.rowid = titles.rowid" % ",".join("?" * len(keys))
+
+        best = None
+        for rowid, cand in conn.execute(sql, keys + [candidates]).fetchall():
+            score = 1.0 if cand == norm else similarity(grams, trigrams(cand))
+            if best is None or score > best[1]:
+                best = (rowid, score)
+
+        if best is None or best[1] < threshold:
+            return None
+
+        row = conn.execute("SELECT data FROM entries WHERE rowid = ?", (best[0],)).fetchone()
+        return model.Entry.from_dict(json.loads(row[0])), best[1]
+
+    def iter_search(self, op_tree, start=0, max_results=None, page_size=const.PAGE_SIZE):
+        """
+            like search, but fetches the results page by page as the generator is consumed.
+
+        :return: generator of model.Entry
+        """
+        end = None if max_results is None else start + max_results
+        while end is None or start < end:
+            count = page_size if end is None else min(page_size, end - start)
+            page = self.search(op_tree, start=start, max_results=count)
+            for e in page:
+                yield e
+            if len(page) < count:
+                return
+            start += len(page)
+
+    def count(self):
+        with self.lock:
+            return self._connect().execute("SELECT count(*) FROM entries").fetchone()[0]
+
+
+# shared by every module that parses entries
+index = LocalIndex()
@@ -0,0 +1,113 @@
+import sys
+
+import const
+
+
+def _split_url(url):
+    # "http://arxiv.org/abs/1807.05705v2" -> ("1807.05705", "v2")
+    m = const.REG_ID_VERSION.match(url.split("/abs/", 1)[-1])
+    return m.group(1), m.group(2)
+
+
+def attrib_items(attrib):
+    # attributes are kept as tuples of interned (key, value) pairs, most of them repeat across entries.
+    return tuple((sys.intern(k), sys.intern(v)) for k, v in attrib.items())
+
+
+class Entry:
+    """
+        a parsed atom:entry.
+
+        to_dict() gives the nested dict layout used in metadata files, from_dict() reads it back.
+    """
+
+    __slots__ = ("url", "updated", "published", "title", "summary", "comment",
+                 "authors", "links", "category", "subcategories", "categories")
+
+    def __init__(self, url, updated=None, published=None, title=None, summary="", comment="",
+                 authors=(), links=(), category=(), subcategories=(), categories=()):
+        self.url = url
+        self.updated = updated
+        self.published = published
+        self.title = title
+        self.summary = summary
+        self.comment = comment
+        self.authors = tuple(authors)
+        self.links = tuple(attrib_items(l) for l in links)
+        self.category = attrib_items(dict(category))
+        self.subcategories = tuple(attrib_items(c) for c in subcategories)
+        # terms of all categories the article is listed in, the primary one included
+        self.categories = tuple(sys.intern(c) for c in categories)
+
+    @property
+    def id(self):
+        return _split_url(self.url)[0]
+
+    @property
+    def version(self):
+        return _split_url(self.url)[1]
+
+    @property
+    def primary_category(self):
+        return dict(self.category).get("term")
+
+    @property
+    def pdf_url(self):
+        for l in self.links:
+            l = dict(l)
+            if "title" in l and "pdf" in l["title"]:
+                return l.get("href")
+        return None
+
+    def to_dict(self):
+        category = dict(self.category)
+        category["category"] = [dict(c) for c in self.subcategories]
+        return {"url": self.url,
+                "time": {"updated": self.updated, "published": self.published},
+                "title": self.title,
+                "summary": self.summary,
+                "comment": self.comment,
+                "authors": list(self.authors),
+                "related-links": [dict(l) for l in self.links],
+                "category": category,
+                "categories": list(self.categories)}
+
+    @classmethod
+    def from_dict(cls, d):
+        category = dict(d.get("category", {}))
+        subcategories = category.pop("category", [])
+        return cls(d["url"], updated=d.get("time", {}).get("updated"), published=d.get("time", {}).get("published"),
+                   title=d.get("title"), summary=d.get("summary", ""), comment=d.get("comment", ""),
+                   authors=d.get("authors", ()), links=d.get("related-links", ()),
+                   category=category, subcategories=subcategories, categories=d.get("categories", ()))
+
+    def __repr__(self):
+        return "Entry(" + repr(self.url) + ")"
+
+
+class Feed:
+    """
+        a parsed api response, the raw xml is only kept when asked for (do_query(keep_xml=True)).
+    """
+
+    __slots__ = ("title", "title_attrib", "total", "start_index", "count", "entries", "xml")
+
+    def __init__(self, title=None, title_attrib=(), total=0, start_index=0, count=0, entries=None, xml=None):
+        self.title = title
+        self.title_attrib = attrib_items(dict(title_attrib))
+        self.total = total
+        self.start_index = start_index
+        self.count = count
+        self.entries = entries if entries is not None else []
+        self.xml = xml
+
+    def to_dict(self):
+        d = {}
+        if self.xml is not None:
+            d["xml"] = self.xml
+        d["title"] = {"attrib": dict(self.title_attrib), "text": self.title}
+        d["opensearch"] = {"result-statics": {"total": self.total,
+                                              "start-index": self.start_index,
+                                              "count": self.count}}
+        d["entries"] = [e.to_dict() for e in self.entries]
+        return d
@@ -0,0 +1,411 @@
+# connectivity
+from urllib.parse import urlencode
+
+# data serialization and parsing
+import io
+import os
+import time
+import json
+
+import const
+import localdb
+import model
+import ratelimit
+import stats
+import xivapi
+
+
+_OAI = "{" + const.oai_namespace["oai"] + "}"
+
+
+class OAIError(Exception):
+    """
+        an OAI-PMH error response (code is the error code defined by the protocol, e.g. badResumptionToken),
+        or a failed http request (code is "http" + status, or just "http" when no response was received).
+    """
+
+    def __init__(self, code, message=""):
+        super().__init__(code + ": " + message if message else code)
+        self.code = code
+        self.message = message
+
+
+def request_page(verb, params, resumption_token=None, base_url=const.OAI_URL, retries=5, delay=const.API_DELAY):
+    """
+        fetch one page of a list request, retries when the server asks to (503 with Retry-After).
+
+    :param params: request arguments (metadataPrefix, from, until, set), ignored when resumption_token is given.
+    :return: raw response body in bytes.
+    """
+
+    if resumption_token is not None:
+        query = {"verb": verb, "resumptionToken": resumption_token}
+    else:
+        query = dict(params)
+        query["verb"] = verb
+
+    url = base_url + "?" + urlencode(query)
+
+    # loaded with the http session, see utils.http_session
+    import requests
+
+    status = None
+    for _ in range(retries):
+        try:
+            resp, content = xivapi.load_stream(url)
+        except requests.RequestException as e:
+            raise OAIError("http", str(e))
+        status = resp["status"]
+
+        if status == "200":
+            return content
+
+        if status != "503":
+            break
+
+        retry_after = resp.get("retry-after", "")
+        wait = int(retry_after) if retry_after.isdigit() else delay
+        time.sleep(wait)
+        stats.recorder.record("wait", wait, url=url, retries=1)
+
+    raise OAIError("http" + str(status), url)
+
+
+def _localname(tag):
+    # "{namespace}name" -> "name"
+    return tag.rpartition("}")[2]
+
+
+def _to_value(el):
+    # leaf elements become their text, others a dict of child name -> value (a list for repeated children),
+    # attributes are kept with a "@" prefix.
+    children = [c for c in el if isinstance(c.tag, str)]
+    text = (el.text or "").strip()
+
+    if len(children) == 0 and len(el.attrib) == 0:
+        return text
+
+    d = {"@" + _localname(k): v for k, v in el.attrib.items()}
+    if len(children) == 0:
+        d["#text"] = text
+        return d
+
+    for c in children:
+        key = _localname(c.tag)
+        v = _to_value(c)
+        if key not in d:
+            d[key] = v
+        elif type(d[key]) is list:
+            d[key].append(v)
+        else:
+            d[key] = [d[key], v]
+
+    return d
+
+
+def _parse_header(el):
+    rec = {"identifier": None, "datestamp": None, "sets": [], "deleted": el.get("status") == "deleted"}
+    for c in el:
+        if c.tag == _OAI + "identifier":
+            rec["identifier"] = c.text
+        elif c.tag == _OAI + "datestamp":
+            rec["datestamp"] = c.text
+        elif c.tag == _OAI + "setSpec":
+            rec["sets"].append(c.text)
+    return rec
+
+
+def iter_page(source):
+    """
+        incrementally parse one ListRecords / ListIdentifiers response.
+
+        yields a dict per record: identifier, datestamp, sets, deleted and, for ListRecords, metadata.
+        the last item yielded is ("resumptionToken", token), token is None on the last page.
+
+    :param source: response body in bytes, or a binary file object.
+    """
+
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+
+    from lxml import etree
+
+    token = None
+    tags = [_OAI + "record", _OAI + "header", _OAI + "resumptionToken", _OAI + "error"]
+    for _, el in etree.iterparse(source, events=("end",), tag=tags):
+        parent = el.getparent()
+
+        if el.tag == _OAI + "error":
+            if el.get("code") == "noRecordsMatch":
+                continue
+            raise OAIError(el.get("code", ""), el.text or "")
+
+        elif el.tag == _OAI + "resumptionToken":
+            token = el.text.strip() if el.text and el.text.strip() else None
+            continue
+
+        elif el.tag == _OAI + "header":
+            if parent is None or parent.tag == _OAI + "record":
+                continue
+            # ListIdentifiers, the header is the whole record
+            rec = _parse_header(el)
+
+        else:
+            rec = None
+            metadata = None
+            for c in el:
+                if c.tag == _OAI + "header":
+                    rec = _parse_header(c)
+                elif c.tag == _OAI + "metadata":
+                    formats = [f for f in c if isinstance(f.tag, str)]
+                    if len(formats) > 0:
+                        metadata = _to_value(formats[0])
+            if rec is None:
+                continue
+            rec["metadata"] = metadata
+
+        el.clear()
+        while el.getprevious() is not None:
+            del parent[0]
+
+        yield rec
+
+    yield "resumptionToken", token
+
+
+def list_records(metadata_prefix="arXiv", from_date=None, until=None, set_spec=None, verb="ListRecords",
+                 resumption_token=None, base_url=const.OAI_URL, delay=const.API_DELAY):
+    """
+        stream all records of a harvest, following resumption tokens.
+
+    :param from_date: "YYYY-MM-DD", records changed on or after this day.
+    :param until: "YYYY-MM-DD", records changed on or before this day.
+    :param set_spec: set to harvest, e.g. "cs" or "physics:hep-th".
+    :param verb: "ListRecords" or "ListIdentifiers"
+    :return: generator of record dicts, see iter_page.
+    """
+
+    for page in iter_pages(verb, harvest_params(metadata_prefix, from_date, until, set_spec),
+                           resumption_token=resumption_token, base_url=base_url, delay=delay):
+        for rec in page[0]:
+            yield rec
+
+
+def list_identifiers(metadata_prefix="arXiv", from_date=None, until=None, set_spec=None, **kwargs):
+    return list_records(metadata_prefix, from_date, until, set_spec, verb="ListIdentifiers", **kwargs)
+
+
+def harvest_params(metadata_prefix="arXiv", from_date=None, until=None, set_spec=None):
+    params = {"metadataPrefix": metadata_prefix}
+    if from_date is not None:
+        params["from"] = from_date
+    if until is not None:
+        params["until"] = until
+    if set_spec is not None:
+        params["set"] = set_spec
+    return params
+
+
+def iter_pages(verb, params, resumption_token=None, base_url=const.OAI_URL, delay=const.API_DELAY):
+    """
+        :return: generator of (records, resumption_token) for each page, resumption_token is None on the last page.
+    """
+
+    limiter = ratelimit.TokenBucket(1 / delay, capacity=1) if delay > 0 else None
+
+    while True:
+        if limiter is not None:
+            limiter.acquire()
+
+        content = request_page(verb, params, resumption_token, base_url=base_url, delay=delay)
+
+        records = []
+        for rec in iter_page(content):
+            if type(rec) is tuple:
+                resumption_token = rec[1]
+            else:
+                records.append(rec)
+
+        yield records, resumption_token
+
+        if resumption_token is None:
+            return
+
+
+def harvest(output, verb="ListRecords", metadata_prefix="arXiv", from_date=None, until=None, set_spec=None,
+            checkpoint=None, restart=False, base_url=const.OAI_URL, delay=const.API_DELAY, on_page=None):
+    """
+        harvest records into output as json lines, one record per line, written page by page.
+
+        after every page the resumption token, the latest datestamp and the size of output are saved to checkpoint. a
+        harvest with the same arguments resumes from there, output is truncated back to the checkpointed size so
+        records of a partially written page are not duplicated.
+
+        if the saved token has expired (badResumptionToken) the harvest starts over with the original arguments:
+        records are not delivered in datestamp order, so restarting from the latest datestamp seen could miss some.
+        records already in output with the same identifier and datestamp are skipped from then on, also when the
+        restarted harvest is resumed; a record changed since it was written is written again, the later line wins.
+
+    :param checkpoint: checkpoint file, defaults to output + ".checkpoint". it is removed once the harvest completes.
+    :param restart: ignore an existing checkpoint and start over.
+    :param on_page: called with the checkpoint state after each page.
+    :return: number of records written by this call.
+    """
+
+    if checkpoint is None:
+        checkpoint = output + ".checkpoint"
+
+    params = harvest_params(metadata_prefix, from_date, until, set_spec)
+
+    state = None
+    if not restart and os.path.exists(checkpoint):
+        with io.open(checkpoint, "r") as f:
+            state = json.load(f)
+        if state.get("verb") != verb or state.get("params") != params or not os.path.exists(output):
+            state = None
+
+    if state is None:
+        state = {"verb": verb, "params": params, "token": None, "datestamp": None, "offset": 0, "count": 0}
+        f_out = io.open(output, "wb")
+    else:
+        f_out = io.open(output, "r+b")
+        f_out.truncate(state["offset"])
+        f_out.seek(state["offset"])
+
+    # (identifier, datestamp) of the records in output, once the harvest has started over
+    seen = _written_records(output, state["offset"]) if state.get("restarted") else None
+
+    written = 0
+    restarts = 0
+    try:
+        while True:
+            try:
+                for records, token in iter_pages(verb, params, state["token"], base_url=base_url, delay=delay):
+                    if seen is not None:
+                        records = [rec for rec in records if (rec["identifier"], rec["datestamp"]) not in seen]
+                    localdb.index.add(to_entry(rec) for rec in records)
+                    for rec in records:
+                        f_out.write(json.dumps(rec, separators=(",", ":")).encode("utf8") + b"\n")
+                        if rec["datestamp"] is not None and (state["datestamp"] is None or rec["datestamp"] > state["datestamp"]):
+                            state["datestamp"] = rec["datestamp"]
+
+                    f_out.flush()
+                    os.fsync(f_out.fileno())
+
+                    written += len(records)
+                    state["count"] += len(records)
+                    state["token"] = token
+                    state["offset"] = f_out.tell()
+                    _save_checkpoint(checkpoint, state)
+
+                    if on_page is not None:
+                        on_page(state)
+                break
+
+            except OAIError as e:
+                if e.code != "badResumptionToken" or state["token"] is None or restarts >= 3:
+                    raise
+                restarts += 1
+                seen = _written_records(output, state["offset"])
+                state["token"] = None
+                state["restarted"] = True
+    finally:
+        f_out.close()
+
+    if os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return written
+
+
+def _written_records(output, offset):
+    # (identifier, datestamp) of the records in the first offset bytes of output
+    seen = set()
+    with io.open(output, "rb") as f:
+        for line in f:
+            if f.tell() > offset:
+                break
+            rec = json.loads(line)
+            seen.add((rec["identifier"], rec["datestamp"]))
+    return seen
+
+
+def _save_checkpoint(checkpoint, state):
+    tmp_name = checkpoint + ".tmp"
+    with io.open(tmp_name, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_name, checkpoint)
+
+
+def to_entry(record):
+    """
+        convert a harvested record (arXiv, arXivRaw or oai_dc metadata) into a model.Entry.
+
+    :return: model.Entry, or None for deleted records and records without metadata.
+    """
+
+    md = record.get("metadata")
+    if record.get("deleted") or type(md) is not dict:
+        return None
+
+    if "id" in md:
+        # arXiv / arXivRaw
+        arxiv_id = md["id"]
+        version = ""
+        versions = md.get("version", [])
+        if type(versions) is not list:
+            versions = [versions]
+        if len(versions) > 0 and type(versions[-1]) is dict:
+            version = versions[-1].get("@version", "")
+
+        authors = md.get("authors", "")
+        if type(authors) is dict:
+            authors = authors.get("author", [])
+            if type(authors) is not list:
+                authors = [authors]
+            authors = [(a.get("forenames", "") + " " + a.get("keyname", "")).strip() for a in authors]
+        else:
+            authors = [a.strip() for a in authors.replace(" and ", ",").split(",") if a.strip() != ""]
+
+        categories = md.get("categories", "").split()
+        created = md.get("created")
+        if created is None and len(versions) > 0 and type(versions[0]) is dict:
+            created = versions[0].get("date")
+
+        return _make_entry(arxiv_id + version, updated=md.get("updated", created), published=created,
+                           title=md.get("title", ""), summary=md.get("abstract", ""), comment=md.get("comments", ""),
+                           authors=authors, categories=categories)
+
+    # oai_dc
+    identifiers = md.get("identifier", [])
+    if type(identifiers) is not list:
+        identifiers = [identifiers]
+    abs_url = [i for i in identifiers if "/abs/" in i]
+    if len(abs_url) == 0:
+        return None
+
+    creators = md.get("creator", [])
+    if type(creators) is not list:
+        creators = [creators]
+    dates = md.get("date", [])
+    if type(dates) is not list:
+        dates = [dates]
+    description = md.get("description", "")
+    if type(description) is list:
+        description = description[0]
+
+    return _make_entry(abs_url[0].split("/abs/", 1)[1], updated=dates[-1] if dates else None,
+                       published=dates[0] if dates else None, title=md.get("title", ""), summary=description,
+                       authors=[" ".join(reversed(c.split(", ", 1))) for c in creators], categories=[])
+
+
+def _make_entry(arxiv_id, updated, published, title, summary="", comment="", authors=(), categories=()):
+    category = {}
+    if len(categories) > 0:
+        category = {"term": categories[0], "scheme": "http://arxiv.org/schemas/atom"}
+
+    return model.Entry("http://arxiv.org/abs/" + arxiv_id, updated=updated, published=published,
+                       title=" ".join(title.split()), summary=summary, comment=comment, authors=authors,
+                       links=[{"href": "http://arxiv.org/abs/" + arxiv_id, "rel": "alternate", "type": "text/html"},
+                              {"title": "pdf", "href": "http://arxiv.org/pdf/" + arxiv_id, "rel": "related",
+                               "type": "application/pdf"}],
+                       category=category, categories=categories)
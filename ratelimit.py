@@ -0,0 +1,225 @@
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # no advisory file locks (windows), the state is kept per process
+    fcntl = None
+
+import stats
+
+
+class TokenBucket:
+    """
+        token bucket rate limiter, safe to share between threads.
+
+        :param rate: tokens refilled per second.
+        :param capacity: max tokens kept in the bucket, i.e. the allowed burst size.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+        # total time callers spent waiting for tokens
+        self.waited = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def acquire(self, tokens=1):
+        """
+            block until the given amount of tokens is available, then take them.
+        """
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+
+            time.sleep(wait)
+            with self.lock:
+                self.waited += wait
+            stats.recorder.record("wait", wait)
+
+
+class AsyncTokenBucket(TokenBucket):
+    """
+        token bucket for coroutines on one event loop, waiting does not block the loop.
+    """
+
+    def __init__(self, rate, capacity=1):
+        super().__init__(rate, capacity)
+        # asyncio is only loaded by the async client
+        import asyncio
+        self.async_lock = asyncio.Lock()
+
+    async def acquire_async(self, tokens=1):
+        import asyncio
+
+        # callers queue on the lock, so tokens are handed out first come first served
+        async with self.async_lock:
+            while True:
+                with self.lock:
+                    self._refill()
+                    if self.tokens >= tokens:
+                        self.tokens -= tokens
+                        return
+                    wait = (tokens - self.tokens) / self.rate
+
+                await asyncio.sleep(wait)
+                with self.lock:
+                    self.waited += wait
+                stats.recorder.record("wait", wait)
+
+
+class AdaptiveLimiter:
+    """
+        token bucket that adapts its rate to the server: the rate is halved when the server pushes back (503 / 429)
+        and the bucket is paused for Retry-After, each successful request raises the rate again by a tenth of the
+        configured rate.
+
+        with a state file, every process using the same file shares the bucket and its current rate, access is
+        serialized with an exclusive lock on the file. without one (or if the file can't be used) the state is kept in
+        this process only.
+
+        :param rate: max requests per second.
+        :param min_rate: lowest rate backing off goes to, rate / 16 by default.
+        :param path: state file shared with other processes.
+    """
+
+    def __init__(self, rate, capacity=1, min_rate=None, path=None):
+        self.max_rate = float(rate)
+        self.min_rate = float(min_rate) if min_rate is not None else self.max_rate / 16
+        self.capacity = float(capacity)
+        self.path = path
+        self.lock = threading.Lock()
+        self.state = self._initial_state(time.time())
+
+        # total time callers of this process spent waiting
+        self.waited = 0.0
+
+    def _initial_state(self, now):
+        return {"tokens": self.capacity, "last": now, "rate": self.max_rate, "paused_until": 0.0}
+
+    def _update(self, func):
+        # run func(state, now) on the current state and save it, under the thread lock and the file lock.
+        with self.lock:
+            if self.path is None or fcntl is None:
+                return func(self.state, time.time())
+
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                with open(self.path, "a+") as f:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                    f.seek(0)
+                    now = time.time()
+                    try:
+                        state = json.loads(f.read())
+                        state["rate"] = min(float(state["rate"]), self.max_rate)
+                    except (ValueError, KeyError, TypeError):
+                        state = self._initial_state(now)
+
+                    ret = func(state, now)
+
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps(state))
+                    f.flush()
+                    return ret
+            except OSError:
+                return func(self.state, time.time())
+
+    def _refill(self, state, now):
+        # wall clock time, it is compared between processes
+        elapsed = max(0.0, now - state["last"])
+        state["tokens"] = min(self.capacity, state["tokens"] + elapsed * state["rate"])
+        state["last"] = now
+
+    def _take(self, tokens):
+        # :return: 0 if the tokens were taken, otherwise seconds to wait before trying again
+
+        def take(state, now):
+            self._refill(state, now)
+            if state["paused_until"] > now:
+                return state["paused_until"] - now
+            if state["tokens"] >= tokens:
+                state["tokens"] -= tokens
+                return 0
+            return (tokens - state["tokens"]) / state["rate"]
+
+        return self._update(take)
+
+    def acquire(self, tokens=1):
+        """
+            block until the given amount of tokens is available, then take them.
+        """
+        while True:
+            wait = self._take(tokens)
+            if wait <= 0:
+                return
+
+            time.sleep(wait)
+            with self.lock:
+                self.waited += wait
+            stats.recorder.record("wait", wait)
+
+    async def acquire_async(self, tokens=1, executor=None):
+        """
+            acquire for coroutines: the state file is locked, read and written in executor (None for the default one of
+            the loop), waiting does not block the loop.
+        """
+        # asyncio is only loaded by the async client
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        while True:
+            wait = await loop.run_in_executor(executor, self._take, tokens)
+            if wait <= 0:
+                return
+
+            await asyncio.sleep(wait)
+            with self.lock:
+                self.waited += wait
+            stats.recorder.record("wait", wait)
+
+    def penalize(self, retry_after=None):
+        """
+            the server refused a request for load: halve the rate, and pause all requests for retry_after seconds.
+        """
+
+        def slow_down(state, now):
+            self._refill(state, now)
+            state["rate"] = max(self.min_rate, state["rate"] / 2)
+            state["tokens"] = min(state["tokens"], 0.0)
+            if retry_after is not None:
+                state["paused_until"] = max(state["paused_until"], now + retry_after)
+            return state["rate"]
+
+        return self._update(slow_down)
+
+    def reward(self):
+        """
+            a request succeeded: raise the rate towards the configured one.
+        """
+
+        def speed_up(state, now):
+            self._refill(state, now)
+            state["rate"] = min(self.max_rate, state["rate"] + self.max_rate / 10)
+            return state["rate"]
+
+        return self._update(speed_up)
+
+    @property
+    def rate(self):
+        return self._update(lambda state, now: state["rate"])
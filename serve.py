@@ -0,0 +1,233 @@
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import traceback
+
+import const
+
+
+class ClientGone(OSError):
+    """
+        the client of a forwarded command disconnected, the command is abandoned at its next output.
+    """
+
+
+class _Output:
+    """
+        file object that sends what a command writes to the client, as messages of one stream ("stdout" / "stderr").
+    """
+
+    def __init__(self, f, stream, lock):
+        self.f = f
+        self.stream = stream
+        self.lock = lock
+
+    def write(self, s):
+        if len(s) > 0:
+            try:
+                _send(self.f, {self.stream: s}, self.lock)
+            except OSError as e:
+                raise ClientGone(str(e))
+        return len(s)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+def _send(f, message, lock=None):
+    data = (json.dumps(message) + "\n").encode("utf8")
+    if lock is None:
+        f.write(data)
+        f.flush()
+        return
+    with lock:
+        f.write(data)
+        f.flush()
+
+
+def _settings():
+    # a daemon started with other settings would run the command against another server or other local data
+    return {"api_url": const.API_URL, "cache_dir": const.CACHE_DIR, "data_dir": const.DATA_DIR}
+
+
+class Server:
+    """
+        daemon that runs forwarded command lines in its own process, so the http connection pool, parsed responses
+        (xivapi.feed_cache) and the api rate limiter stay warm from one command to the next.
+
+        a client sends one json line {"argv": [...], "cwd": ..., "settings": ...} and receives json lines
+        {"stdout": text} and {"stderr": text} while the command runs, then {"exit": status}. a request the daemon can
+        not run, e.g. from a client with another api url, is answered with {"refused": reason} and the client runs the
+        command itself. {"stop": true} shuts the daemon down.
+
+        commands run one at a time: they share the working directory, sys.stdout and sys.stderr of the process. api
+        requests are limited to one every few seconds anyway, other clients wait on the socket meanwhile.
+
+        :param run: function(argv) that runs a command line, returns the exit status.
+        :param path: unix socket, readable by the current user only.
+    """
+
+    def __init__(self, run, path=const.SERVE_SOCKET):
+        self.run = run
+        self.path = path
+        self.lock = threading.Lock()
+        self.server = None
+
+    def _handler(self):
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+
+            def handle(self):
+                try:
+                    request = json.loads(self.rfile.readline())
+                except ValueError:
+                    return
+
+                if request.get("stop"):
+                    _send(self.wfile, {"exit": 0})
+                    threading.Thread(target=daemon.server.shutdown).start()
+                    return
+
+                if request.get("settings") != _settings():
+                    _send(self.wfile, {"refused": "the daemon runs with other settings: " + json.dumps(_settings())})
+                    return
+
+                with daemon.lock:
+                    status = daemon._run(request, self.wfile)
+
+                try:
+                    _send(self.wfile, {"exit": status})
+                except OSError:
+                    pass
+
+        return Handler
+
+    def _run(self, request, f):
+        lock = threading.Lock()
+        stdout, stderr, cwd = sys.stdout, sys.stderr, os.getcwd()
+        sys.stdout, sys.stderr = _Output(f, "stdout", lock), _Output(f, "stderr", lock)
+        try:
+            os.chdir(request["cwd"])
+            status = self.run(request["argv"])
+        except SystemExit as e:
+            status = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        except ClientGone:
+            status = 1
+        except Exception:
+            try:
+                traceback.print_exc()
+            except ClientGone:
+                pass
+            status = 1
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+            os.chdir(cwd)
+
+        return status if status is not None else 0
+
+    def serve_forever(self):
+        """
+            listen on path until stop() or a {"stop": true} request.
+
+            :raise OSError: if another daemon is listening on path.
+        """
+        if os.path.exists(self.path):
+            if running(self.path):
+                raise OSError("a daemon is already listening on " + self.path)
+            # left behind by a daemon that did not shut down cleanly
+            os.remove(self.path)
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        umask = os.umask(0o177)
+        try:
+            self.server = socketserver.ThreadingUnixStreamServer(self.path, self._handler())
+        finally:
+            os.umask(umask)
+        self.server.daemon_threads = True
+
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+
+
+def _connect(path):
+    if not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def running(path=const.SERVE_SOCKET):
+    """
+        :return: True if a daemon is listening on path.
+    """
+    sock = _connect(path)
+    if sock is None:
+        return False
+    sock.close()
+    return True
+
+
+def forward(argv, path=const.SERVE_SOCKET):
+    """
+        run a command line in the daemon listening on path, its output is written to sys.stdout and sys.stderr.
+
+    :return: exit status of the command, or None if no daemon is running or it refused the command, the caller then
+        runs the command itself.
+    """
+    sock = _connect(path)
+    if sock is None:
+        return None
+
+    with sock, sock.makefile("rwb") as f:
+        try:
+            _send(f, {"argv": argv, "cwd": os.getcwd(), "settings": _settings()})
+            for line in f:
+                message = json.loads(line)
+                if "stdout" in message:
+                    sys.stdout.write(message["stdout"])
+                elif "stderr" in message:
+                    sys.stderr.write(message["stderr"])
+                elif "exit" in message:
+                    sys.stdout.flush()
+                    return message["exit"]
+                elif "refused" in message:
+                    return None
+        except (OSError, ValueError):
+            pass
+
+    print("arxiv: error: lost the connection to the daemon", file=sys.stderr)
+    return 1
+
+
+def stop(path=const.SERVE_SOCKET):
+    """
+        :return: True if a daemon was listening on path and is shutting down.
+    """
+    sock = _connect(path)
+    if sock is None:
+        return False
+
+    with sock, sock.makefile("rwb") as f:
+        _send(f, {"stop": True})
+        f.readline()
+    return True
@@ -0,0 +1,101 @@
+import io
+import json
+import threading
+import time
+
+
+def percentile(values, p):
+    """
+        :return: the p-th percentile (0..100) of values by the nearest rank, None if values is empty.
+    """
+    if len(values) == 0:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(p / 100 * len(values) + 0.5)) - 1))]
+
+
+class Recorder:
+    """
+        timing events of requests, parsing, transfers and rate limit waits, safe to share between threads.
+
+        events are dicts with at least "event" (the kind, e.g. "request", "parse", "download", "wait") and
+        "duration" in seconds, plus "bytes", "status", "retries" or "url" where they apply.
+
+        nothing is recorded unless enabled (events kept for summary()) or a trace file is open (one json line per
+        event, written as it happens).
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.trace = None
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+
+    @property
+    def active(self):
+        return self.enabled or self.trace is not None
+
+    def reset(self):
+        # start over, for a process that runs several commands (arxiv serve)
+        with self.lock:
+            self.events = []
+            self.started = time.monotonic()
+
+    def open_trace(self, filename):
+        self.trace = io.open(filename, "a", encoding="utf8")
+
+    def close(self):
+        with self.lock:
+            if self.trace is not None:
+                self.trace.close()
+                self.trace = None
+
+    def record(self, event, duration, **fields):
+        if not self.active:
+            return
+
+        fields["event"] = event
+        fields["duration"] = duration
+
+        with self.lock:
+            if self.enabled:
+                self.events.append(fields)
+            if self.trace is not None:
+                fields = dict(fields, time=time.time())
+                self.trace.write(json.dumps(fields, separators=(",", ":")) + "\n")
+
+    def summary(self):
+        """
+            :return: lines of a summary table: count, p50 / p95 duration, bytes and throughput per kind of event.
+        """
+        with self.lock:
+            events = list(self.events)
+
+        kinds = {}
+        for e in events:
+            kinds.setdefault(e["event"], []).append(e)
+
+        wall = time.monotonic() - self.started
+        lines = ["{:<10s}{:>8s}{:>10s}{:>10s}{:>10s}{:>12s}{:>10s}".format(
+            "event", "count", "p50 ms", "p95 ms", "total s", "bytes", "MiB/s")]
+
+        for kind in sorted(kinds):
+            durations = [e["duration"] for e in kinds[kind]]
+            total = sum(durations)
+            n_bytes = sum(e.get("bytes", 0) for e in kinds[kind])
+            rate = n_bytes / total / 2 ** 20 if total > 0 and n_bytes > 0 else 0
+            lines.append("{:<10s}{:>8d}{:>10.1f}{:>10.1f}{:>10.2f}{:>12,d}{:>10.2f}".format(
+                kind, len(durations), percentile(durations, 50) * 1000, percentile(durations, 95) * 1000, total,
+                n_bytes, rate))
+
+        retries = sum(e.get("retries", 0) for e in events)
+        # a retried request is recorded once more as a wait, only the requests themselves count as failed
+        errors = len([e for e in events if e["event"] in ["request", "download"]
+                      and e.get("status") not in [None, 200, 206, 304, 416]])
+        lines.append("wall time: %.2f s, retries: %d, failed requests: %d" % (wall, retries, errors))
+        return lines
+
+
+# shared by every module that sends requests, parses responses or waits for rate limits
+recorder = Recorder()
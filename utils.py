@@ -1,9 +1,14 @@
-import urllib3
 import sys
 import time
 import os
-import requests
 import io
+import json
+import hashlib
+import signal
+import threading
+
+import const
+import stats
 
 
 def get_terminal_size():
@@ -93,25 +98,77 @@ def _get_terminal_size_linux():
     return int(cr[1]), int(cr[0])
 
 
-def show_progress_bar(ratio, bytes_per_second=None, bar_indicator_char="#"):
-    term_w, _ = get_terminal_size()
+_terminal_size = None
+_terminal_size_time = 0
+_sigwinch_installed = False
+
+# without a SIGWINCH handler the cached size is probed again after this many seconds
+_TERMINAL_SIZE_TTL = 1
+
+
+def _on_sigwinch(signum, frame):
+    global _terminal_size
+    _terminal_size = None
+
+
+def watch_terminal_size():
+    """
+        drop the cached terminal size whenever the terminal is resized (SIGWINCH). signal handlers can only be
+        installed from the main thread, call this there before the size is read from other threads.
+
+    :return: True if the handler is installed.
+    """
+    global _sigwinch_installed
+
+    if not _sigwinch_installed and hasattr(signal, "SIGWINCH"):
+        try:
+            signal.signal(signal.SIGWINCH, _on_sigwinch)
+            _sigwinch_installed = True
+        except ValueError:
+            # not the main thread
+            pass
+
+    return _sigwinch_installed
+
+
+def cached_terminal_size():
+    """
+        get_terminal_size() probed once and kept until the terminal is resized (SIGWINCH), see watch_terminal_size.
+        if no handler could be installed the size is probed again at most once a second.
+    """
+    global _terminal_size, _terminal_size_time
+
+    if threading.current_thread() is threading.main_thread():
+        watch_terminal_size()
+
+    tuple_xy = _terminal_size
+    now = time.monotonic()
+    if tuple_xy is None or (not _sigwinch_installed and now - _terminal_size_time > _TERMINAL_SIZE_TTL):
+        tuple_xy = get_terminal_size()
+        if tuple_xy[0] <= 0:
+            tuple_xy = (80, 25)
+        _terminal_size, _terminal_size_time = tuple_xy, now
+
+    return tuple_xy
 
-    spd = bytes_per_second
+
+def format_progress_bar(ratio, bytes_per_second=None, term_w=80, bar_indicator_char="#"):
+    """
+        :return: the progress bar line for a terminal term_w columns wide.
+    """
 
     if bar_indicator_char is None or len(bar_indicator_char) < 0:
         bar_indicator_char = "#"
 
     if term_w < 20:
         percent = "[% 3.2f%%]" % (ratio * 100,)
-        print("\r" + "{:>?s}".replace("?", str(term_w)).format(percent), end="")
-        pass
+        return "{:>?s}".replace("?", str(term_w)).format(percent)
     elif term_w < 50:
         percent = "[% 3.2f%%]" % (ratio * 100,)
         ll = len(percent)
         l_prog = (term_w - ll - 2)
         l_done = int(l_prog * ratio + 0.5)
-        print("\r[" + bar_indicator_char[0] * l_done + " " * (l_prog - l_done) + "]" + " " * (ll - len(percent)) + percent, end="")
-        pass
+        return "[" + bar_indicator_char[0] * l_done + " " * (l_prog - l_done) + "]" + " " * (ll - len(percent)) + percent
     else:
 
         percent = "[% 3.2f%%]" % (ratio * 100,)
@@ -141,11 +198,111 @@ def show_progress_bar(ratio, bytes_per_second=None, bar_indicator_char="#"):
                 unit = 5
 
             foot = "{:>12s}".format(fit.format(bytes_per_second) + " " + units[unit] + " ")
-            print("\r[" + bar_indicator_char[0] * l_done + " " * (l_prog - l_done) + "]" + foot + percent, end="")
+            return "[" + bar_indicator_char[0] * l_done + " " * (l_prog - l_done) + "]" + foot + percent
         else:
-            print("\r[" + bar_indicator_char[0] * l_done + " " * (l_prog - l_done) + "]" + " " * (ll - len(percent)) + percent, end="")
-        sys.stdout.flush()
-        time.sleep(0.001)
+            return "[" + bar_indicator_char[0] * l_done + " " * (l_prog - l_done) + "]" + " " * (ll - len(percent)) + percent
+
+
+def show_progress_bar(ratio, bytes_per_second=None, bar_indicator_char="#"):
+    term_w, _ = cached_terminal_size()
+    print("\r" + format_progress_bar(ratio, bytes_per_second, term_w, bar_indicator_char), end="")
+    sys.stdout.flush()
+
+
+class ProgressDisplay:
+    """
+        progress bars of one or more concurrent transfers, one line each.
+
+        updates are cheap: lines are redrawn at most fps times per second, speed is an exponential moving average
+        sampled at least every 0.1 second. nothing is drawn if the stream is not a tty.
+    """
+
+    SAMPLE_INTERVAL = 0.1
+    SMOOTHING = 0.3
+
+    def __init__(self, fps=const.PROGRESS_FPS, stream=None, bar_indicator_char="="):
+        self.stream = stream if stream is not None else sys.stdout
+        self.enabled = hasattr(self.stream, "isatty") and self.stream.isatty()
+        self.interval = 1 / fps
+        self.bar_indicator_char = bar_indicator_char
+        self.lock = threading.Lock()
+        self.transfers = {}
+        self.lines_drawn = 0
+        self.last_render = 0
+
+        # transfers report progress from worker threads, the resize handler has to be installed from here
+        watch_terminal_size()
+
+    def start(self, key, name, total=None, loaded=0):
+        """
+            add a transfer, total is its size in bytes (None if unknown), loaded the bytes already present.
+        """
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self.lock:
+            self.transfers[key] = {"name": name, "total": total, "loaded": loaded, "speed": None,
+                                   "sample_time": now, "sample_loaded": loaded}
+            self._render(now, force=True)
+
+    def update(self, key, n_bytes):
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self.lock:
+            t = self.transfers.get(key)
+            if t is None:
+                return
+            t["loaded"] += n_bytes
+
+            dt = now - t["sample_time"]
+            if dt >= self.SAMPLE_INTERVAL:
+                speed = (t["loaded"] - t["sample_loaded"]) / dt
+                t["speed"] = speed if t["speed"] is None else self.SMOOTHING * speed + (1 - self.SMOOTHING) * t["speed"]
+                t["sample_time"], t["sample_loaded"] = now, t["loaded"]
+
+            if now - self.last_render >= self.interval:
+                self._render(now)
+
+    def finish(self, key):
+        """
+            remove a transfer, its final state is left on screen above the running ones.
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            t = self.transfers.pop(key, None)
+            if t is None:
+                return
+            self._clear()
+            self.stream.write(self._line(t, cached_terminal_size()[0]) + "\n")
+            self._render(time.monotonic(), force=True)
+
+    def _line(self, t, term_w):
+        ratio = t["loaded"] / t["total"] if t["total"] else 0
+        if t["name"] is None:
+            return format_progress_bar(ratio, t["speed"], term_w, self.bar_indicator_char)
+
+        name = "{:<25s}".format(t["name"][:24])
+        return name + format_progress_bar(ratio, t["speed"], term_w - len(name), self.bar_indicator_char)
+
+    def _clear(self):
+        if self.lines_drawn > 1:
+            self.stream.write("\x1b[" + str(self.lines_drawn - 1) + "F")
+        self.stream.write("\r\x1b[J")
+        self.lines_drawn = 0
+
+    def _render(self, now, force=False):
+        if not force and now - self.last_render < self.interval:
+            return
+        self.last_render = now
+
+        term_w = cached_terminal_size()[0]
+        self._clear()
+        lines = [self._line(t, term_w) for t in self.transfers.values()]
+        self.stream.write("\n".join(lines))
+        self.lines_drawn = len(lines)
+        self.stream.flush()
 
 
 def filename_filter(txt):
@@ -157,39 +314,431 @@ def filename_filter(txt):
     return txt
 
 
-def download_file(url, filename, user_agent):
+# one pooled session shared by every request pyXiv sends, connections are kept alive between requests.
+_session = None
+_session_lock = threading.Lock()
 
-    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-    headers = {'User-Agent': user_agent}
+# (connect, read) timeouts of http requests in seconds
+http_timeout = const.HTTP_TIMEOUT
 
-    show_progress_bar(0, bytes_per_second=0)
 
-    last_time = time.time()
+def http_session():
+    """
+        :return: the shared requests.Session, created on first use.
+    """
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            # requests is only loaded by commands that go online, it is a large share of the cli's startup time
+            import requests
 
-    s = requests.Session()
-    s.verify = False
-    s.stream = True
+            s = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=const.HTTP_POOL_SIZE,
+                                                    pool_maxsize=const.HTTP_POOL_SIZE)
+            s.mount("http://", adapter)
+            s.mount("https://", adapter)
+            s.headers.update({"User-Agent": const.USER_AGENT, "Accept-Encoding": "gzip, deflate"})
+            _session = s
 
-    req = requests.Request('GET', url, headers=headers)
-    req_prep = req.prepare()
+    return _session
 
-    resp_stream = s.send(req_prep)
 
-    if resp_stream.status_code == 200:
-        len_total = int(resp_stream.headers["content-length"])
-        len_loaded = 0
-        f_out = io.open(filename, 'wb')
-        for chunk in resp_stream.iter_content(chunk_size=1024*128):
-            if chunk:
-                t_now = time.time()
-                t_diff = (t_now - last_time)
-                last_time = t_now
-                len_loaded += len(chunk)
-                f_out.write(chunk)
+def http_get(url, headers=None, stream=False, timeout=None, **kwargs):
+    """
+        send a GET request with the shared session.
+
+    :return: requests.Response
+    """
+    return http_session().get(url, headers=headers, stream=stream,
+                              timeout=timeout if timeout is not None else http_timeout, **kwargs)
+
+
+def download_file(url, filename, user_agent, show_progress=True, progress=None, expected_sha256=None, result=None,
+                  limiter=None, validators=None):
+    """
+        download url into filename.
+
+        data is written to filename + ".part" first, and renamed to filename once the transfer is complete and matches
+        content-length (and expected_sha256 if given). an existing .part file is resumed with a Range request, an
+        existing filename is considered complete and skipped. the url, etag and last-modified of a transfer are kept
+        in filename + ".part.validators", a resumed request is conditional on them (If-Range) so bytes of another
+        document or revision are never appended, a .part file without them is downloaded again.
+
+        the .part file is preallocated from content-length where the platform supports it, the number of bytes
+        actually written is kept next to it in filename + ".part.offset" so a preallocated file can be resumed.
+
+    :param progress: ProgressDisplay shared with other transfers, by default a progress bar of its own is shown.
+    :param expected_sha256: reject the download if its digest differs.
+    :param result: if given, this dict receives "size", "sha256", and "etag" / "last_modified" if the server sent
+        them, of the downloaded file. or "skipped": True, or "not_modified": True.
+    :param limiter: rate limiter (ratelimit.TokenBucket) acquired right before the request, a skipped file takes
+        no token.
+    :param validators: dict with the "etag" and / or "last_modified" recorded for the existing filename (see
+        response_validators): instead of being skipped, filename is checked with a conditional request and replaced
+        unless the server answers 304 Not Modified. an empty dict replaces filename unconditionally.
+    :return: True if the file is downloaded, False if the server refused the request, the transfer is incomplete or
+        the file fails verification.
+    """
+
+    if result is None:
+        result = {}
+
+    revalidate = validators is not None and os.path.exists(filename)
+    if os.path.exists(filename) and not revalidate:
+        result["skipped"] = True
+        return True
+
+    # a transfer on a shared display is labelled with its file name
+    name = os.path.basename(filename)
+    if not show_progress:
+        progress = None
+    elif progress is None:
+        progress, name = ProgressDisplay(), None
+
+    # content-length and ranges refer to the file itself, it must not be transfer-compressed
+    headers = {'User-Agent': user_agent, 'Accept-Encoding': 'identity'}
+
+    part_name = filename + ".part"
+    offset_name = part_name + ".offset"
+    len_loaded = part_offset(part_name, offset_name)
+    part = None
+    if len_loaded > 0:
+        part = load_part_validators(part_name, url)
+        if part is None:
+            remove_part(part_name)
+            len_loaded = 0
+        else:
+            headers.update(resume_headers(part, len_loaded))
+    if revalidate:
+        headers.update(conditional_headers(validators))
+
+    if limiter is not None:
+        limiter.acquire()
+    t = time.perf_counter()
+    status = None
+    transferred = 0
+    try:
+        resp_stream = http_get(url, headers=headers, stream=True)
+        status = resp_stream.status_code
+
+        # an adaptive limiter slows every transfer down when the server pushes back
+        if status in [429, 503] and hasattr(limiter, "penalize"):
+            limiter.penalize(retry_after_seconds(resp_stream.headers.get("retry-after")))
+        elif status < 400 and hasattr(limiter, "reward"):
+            limiter.reward()
+
+        if resp_stream.status_code == 304:
+            # the copy on disk is current, a transfer started before it is obsolete
+            resp_stream.close()
+            remove_part(part_name)
+            result["not_modified"] = True
+            return True
+
+        current = response_validators({k.lower(): v for k, v in resp_stream.headers.items()})
+        if resp_stream.status_code in [206, 416] and not same_document(part, current):
+            # the server resumed another revision than the one in the .part file, start over next time
+            resp_stream.close()
+            remove_part(part_name)
+            return False
+
+        if resp_stream.status_code == 416:
+            # nothing left to fetch beyond the .part file, it is complete if its size matches the total length.
+            len_total = content_range_total(resp_stream.headers.get("content-range"))
+            resp_stream.close()
+            if len_total is None or len_total != len_loaded:
+                return False
+            mode = None
+        elif resp_stream.status_code == 206:
+            mode = 'r+b'
+            len_total = content_range_total(resp_stream.headers.get("content-range"))
+        elif resp_stream.status_code == 200:
+            # a fresh download, or the server ignored the Range header
+            mode = 'wb'
+            len_loaded = 0
+            len_total = None
+        else:
+            resp_stream.close()
+            return False
+
+        result.update(current)
+
+        if mode is not None and len_total is None and "content-length" in resp_stream.headers:
+            len_total = len_loaded + int(resp_stream.headers["content-length"])
+
+        # the digest covers bytes kept from an earlier attempt as well
+        sha256 = hashlib.sha256()
+        if len_loaded > 0:
+            _hash_file(sha256, part_name, len_loaded)
+
+        if mode is not None:
+            if progress is not None:
+                progress.start(filename, name, len_total, len_loaded)
+
+            if mode == 'wb':
+                save_part_validators(part_name, url, current)
+            f_out = io.open(part_name, mode)
+            try:
+                if mode == 'wb' and len_total:
+                    _save_part_offset(offset_name, 0)
+                    _preallocate(f_out, len_total)
+                f_out.seek(len_loaded)
+
+                last_saved = len_loaded
+                for chunk in resp_stream.iter_content(chunk_size=1024*128):
+                    if chunk:
+                        len_loaded += len(chunk)
+                        transferred += len(chunk)
+                        f_out.write(chunk)
+                        sha256.update(chunk)
+                        if progress is not None:
+                            progress.update(filename, len(chunk))
+                        if len_loaded - last_saved >= _OFFSET_SAVE_INTERVAL:
+                            f_out.flush()
+                            _save_part_offset(offset_name, len_loaded)
+                            last_saved = len_loaded
+            finally:
                 f_out.flush()
-                show_progress_bar(len_loaded / len_total, bytes_per_second=len(chunk)/t_diff, bar_indicator_char='=')
+                if os.path.exists(offset_name):
+                    _save_part_offset(offset_name, len_loaded)
+                f_out.close()
+                if progress is not None:
+                    progress.finish(filename)
+
+        if len_total is not None and len_loaded != len_total:
+            return False
+
+        if expected_sha256 is not None and sha256.hexdigest() != expected_sha256.lower():
+            # the bytes on disk are wrong, resuming from them would not help
+            remove_part(part_name)
+            return False
+
+        if os.path.getsize(part_name) != len_loaded:
+            os.truncate(part_name, len_loaded)
+
+        os.replace(part_name, filename)
+        remove_part(part_name)
+
+        result["size"] = len_loaded
+        result["sha256"] = sha256.hexdigest()
+        return True
+    finally:
+        stats.recorder.record("download", time.perf_counter() - t, url=url, status=status, bytes=transferred)
+
+
+# bytes written between updates of the .part.offset file
+_OFFSET_SAVE_INTERVAL = 4 * 1024 * 1024
+
+
+def part_offset(part_name, offset_name=None):
+    """
+        :return: bytes of a .part file that hold downloaded data, a preallocated file is larger than that.
+    """
+    if offset_name is None:
+        offset_name = part_name + ".offset"
+    if not os.path.exists(part_name):
+        return 0
+
+    size = os.path.getsize(part_name)
+    if os.path.exists(offset_name):
+        try:
+            with io.open(offset_name, "r") as f:
+                return min(size, int(f.read().strip()))
+        except ValueError:
+            return 0
+
+    return size
+
+
+def load_part_validators(part_name, url):
+    """
+        :return: the validators of the transfer a .part file was started with (see save_part_validators), None if it
+            was started from another url or can not be told apart from another revision: it must not be resumed.
+    """
+    try:
+        with io.open(part_name + ".validators", "r") as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return None
 
-        f_out.close()
-        # h = Http()
-        # resp, content = h.request(url, 'GET', headers=headers)
-        print()
+    if type(saved) is not dict or saved.get("url") != url or resume_headers(saved, 1) is None:
+        return None
+    return saved
+
+
+def save_part_validators(part_name, url, validators):
+    with io.open(part_name + ".validators", "w") as f:
+        json.dump(dict(validators, url=url), f)
+
+
+def resume_headers(validators, offset):
+    """
+        :return: Range and If-Range headers that resume a transfer at offset, the server sends the whole document
+            instead if it changed since. None if there is no validator If-Range can use (a strong etag or a date).
+    """
+    etag = validators.get("etag")
+    if etag is not None and not etag.startswith("W/"):
+        condition = etag
+    elif validators.get("last_modified") is not None:
+        condition = validators["last_modified"]
+    else:
+        return None
+    return {"Range": "bytes=" + str(offset) + "-", "If-Range": condition}
+
+
+def same_document(saved, current):
+    """
+        :return: True unless the validators of a partial response contradict those the .part file was started with.
+    """
+    if saved is None:
+        return False
+    for k in ["etag", "last_modified"]:
+        if saved.get(k) is not None and current.get(k) is not None:
+            return saved[k] == current[k]
+    return True
+
+
+def remove_part(part_name):
+    """
+        remove a .part file and the files kept next to it.
+    """
+    for f in [part_name, part_name + ".offset", part_name + ".validators"]:
+        if os.path.exists(f):
+            os.remove(f)
+
+
+def _save_part_offset(offset_name, offset):
+    with io.open(offset_name, "w") as f:
+        f.write(str(offset))
+
+
+def _preallocate(f, size):
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(f.fileno(), 0, size)
+        except OSError:
+            # not supported by the file system, the file grows as it is written instead.
+            pass
+
+
+def _hash_file(sha256, filename, length=None):
+    with io.open(filename, "rb") as f:
+        while length is None or length > 0:
+            block = f.read(1024 * 1024 if length is None else min(1024 * 1024, length))
+            if not block:
+                break
+            sha256.update(block)
+            if length is not None:
+                length -= len(block)
+
+
+def verify_file(filename, size=None, sha256=None):
+    """
+        check a downloaded file against the size and sha256 digest recorded for it.
+
+    :return: True if the file exists and matches.
+    """
+    if not os.path.exists(filename):
+        return False
+
+    if size is not None and os.path.getsize(filename) != size:
+        return False
+
+    if sha256 is not None:
+        h = hashlib.sha256()
+        _hash_file(h, filename)
+        if h.hexdigest() != sha256.lower():
+            return False
+
+    return True
+
+
+def retry_after_seconds(retry_after):
+    """
+        :return: seconds to wait from a Retry-After header (seconds or an http date), or None.
+    """
+    if retry_after is None:
+        return None
+
+    retry_after = retry_after.strip()
+    if retry_after.isdigit():
+        return int(retry_after)
+
+    try:
+        import email.utils
+        when = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def content_range_total(content_range):
+    """
+        :return: total length from a Content-Range header ("bytes 100-199/200" or "bytes */200"), or None.
+    """
+    if content_range is None or "/" not in content_range:
+        return None
+
+    total = content_range.rsplit("/", 1)[1].strip()
+    if not total.isdigit():
+        return None
+
+    return int(total)
+
+
+def response_validators(headers):
+    """
+        :return: dict with the "etag" and "last_modified" of a response (headers with lower case keys), the ones it
+            has.
+    """
+    validators = {}
+    if headers.get("etag"):
+        validators["etag"] = headers["etag"]
+    if headers.get("last-modified"):
+        validators["last_modified"] = headers["last-modified"]
+    return validators
+
+
+def conditional_headers(validators):
+    """
+        :return: If-None-Match / If-Modified-Since headers that revalidate a copy with validators (see
+            response_validators), the server answers 304 Not Modified if the copy is still current.
+    """
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+
+def download_batch(tasks, user_agent, jobs=1, limiter=None, show_progress=True):
+    """
+        download several files with a pool of workers.
+
+    :param tasks: list of (url, filename) or (url, filename, validators) tuples, see download_file.
+    :param jobs: number of concurrent transfers, each running transfer has a progress bar of its own.
+    :param limiter: shared rate limiter (ratelimit.TokenBucket), acquired before each request that is sent.
+    :return: list of (url, filename, error, info) in the order of tasks, error is None for a successful download,
+        info is the result dict of download_file.
+    """
+
+    progress = ProgressDisplay() if show_progress else None
+
+    def worker(task):
+        url, filename = task[:2]
+        validators = task[2] if len(task) > 2 else None
+        info = {}
+        try:
+            if download_file(url, filename, user_agent, show_progress=show_progress, progress=progress, result=info,
+                             limiter=limiter, validators=validators):
+                return url, filename, None, info
+            return url, filename, "server refused the request or the transfer is incomplete.", info
+        except Exception as e:
+            return url, filename, str(e), info
+
+    import concurrent.futures
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        return list(pool.map(worker, tasks))
@@ -0,0 +1,115 @@
+import io
+import json
+import os
+import time
+
+import const
+import xivapi
+
+
+def load_watch_list(filename):
+    """
+        read a watch list, a json file with a list of op-trees (see xivapi.get_query_string), or an object that maps
+        names to op-trees:
+
+            {"hardware": {"op": "and", "term1": {"op": "cat", "term": "cs.AR"}, "term2": {"op": "all", "term": "sparse"}},
+             "han": {"op": "au", "term": "song han"}}
+
+    :return: list of (name, query string), a list item is named by its query string.
+    """
+
+    with io.open(filename, "r", encoding="utf8") as f:
+        doc = json.load(f)
+
+    items = doc.items() if type(doc) is dict else [(None, op_tree) for op_tree in doc]
+
+    watch_list = []
+    for name, op_tree in items:
+        query_string = xivapi.get_query_string(op_tree)
+        if query_string is None:
+            raise ValueError("malformed op-tree in watch list: " + json.dumps(op_tree))
+        watch_list.append((name if name is not None else query_string, query_string))
+
+    return watch_list
+
+
+class WatchState:
+    """
+        high-water marks of watched queries, kept in one json file that maps a query string to its mark:
+        {"published": newest submission date seen, "ids": IDs submitted at that date, "synced": time of the last sync}.
+
+        :param path: state file.
+    """
+
+    def __init__(self, path=const.SYNC_STATE):
+        self.path = path
+        self.marks = {}
+        if os.path.exists(path):
+            with io.open(path, "r", encoding="utf8") as f:
+                self.marks = json.load(f)
+
+    def mark(self, query_string):
+        return self.marks.get(query_string)
+
+    def advance(self, query_string, entries):
+        """
+            move the mark of a query past entries (newest first, see new_entries).
+        """
+        mark = self.marks.get(query_string)
+        if len(entries) > 0 and entries[0].published is not None:
+            newest = entries[0].published
+            ids = [e.id for e in entries if e.published == newest]
+            if mark is not None and mark["published"] == newest:
+                ids = mark["ids"] + [i for i in ids if i not in mark["ids"]]
+            if mark is None or mark["published"] <= newest:
+                mark = {"published": newest, "ids": ids}
+
+        if mark is not None:
+            mark["synced"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+            self.marks[query_string] = mark
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_name = self.path + "." + str(os.getpid()) + ".tmp"
+        with io.open(tmp_name, "w", encoding="utf8") as f:
+            json.dump(self.marks, f, indent=1)
+        os.replace(tmp_name, self.path)
+
+
+def new_entries(query_string, mark=None, max_results=None, page_size=const.PAGE_SIZE):
+    """
+        entries of a query submitted after its high-water mark, newest first.
+
+        pages sorted by submittedDate descending are requested one at a time, and paging stops at the first entry
+        submitted before the mark, so a query with few new entries costs a single request.
+
+    :param mark: high-water mark, see WatchState. None takes the newest max_results entries.
+    :param max_results: stop after this many new entries, None for all of them.
+    :return: (list of model.Entry, True if every request succeeded)
+    """
+
+    entries = []
+    offset = 0
+    while max_results is None or len(entries) < max_results:
+        count = page_size if max_results is None else min(page_size, max_results - len(entries))
+        resp = xivapi.do_query(search_query=query_string, start=offset, max_results=count,
+                               sort_by="submittedDate", sort_order="descending")
+        feed = resp["feed"]
+        if feed is None:
+            return entries, False
+
+        for e in feed.entries:
+            if mark is not None and e.published is not None:
+                if e.published < mark["published"]:
+                    return entries, True
+                if e.published == mark["published"] and e.id in mark["ids"]:
+                    continue
+            entries.append(e)
+            if max_results is not None and len(entries) >= max_results:
+                break
+
+        offset += len(feed.entries)
+        if len(feed.entries) == 0 or offset >= feed.total:
+            break
+
+    return entries, True
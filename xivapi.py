@@ -1,25 +1,119 @@
 # connectivity
-import requests
-import urllib3
-from httplib2 import Http
 from urllib.parse import urlencode
 
 # data serialization and parsing
 import re
 import argparse
 import json
-from lxml import etree
+import io
+import os
+import time
+import random
 
 import utils
 import const
+import cache
+import localdb
+import model
+import ratelimit
+import stats
+
+# raw api responses are kept on disk, see: cache.ResponseCache
+response_cache = cache.ResponseCache()
+
+# parsed responses kept in memory by the daemon (arxiv serve), see: cache.MemoryCache
+feed_cache = cache.MemoryCache()
+
+# api requests of all pyXiv processes on this host share one adaptive rate limit
+api_limiter = ratelimit.AdaptiveLimiter(1 / const.API_DELAY, path=os.path.join(const.RATE_STATE_DIR, "api.json"))
+
+# responses worth another try
+_RETRY_STATUS = ["429", "500", "502", "503", "504"]
+
+
+def load_stream(url, ua=const.USER_AGENT, headers=None):
+    """
+        :param headers: request headers sent in addition to the user agent.
+        :return: (resp, content) where content is the raw response body in bytes, resp is a dict of the response
+            headers (lower case) plus "status".
+    """
+    t = time.perf_counter()
+    r = utils.http_get(url, headers=dict(headers or {}, **{'User-Agent': ua}))
+    content = r.content
+    stats.recorder.record("request", time.perf_counter() - t, url=url, status=r.status_code, bytes=len(content))
+
+    resp = {k.lower(): v for k, v in r.headers.items()}
+    resp["status"] = str(r.status_code)
+    return resp, content
+
+
+def request(url, retries=const.API_RETRIES, ua=const.USER_AGENT, headers=None):
+    """
+        load_stream with the shared api rate limit, and retries of failed requests.
+
+        429 and 503 responses slow the rate limit down, their Retry-After is honored. other retries wait with
+        exponential backoff and jitter.
+
+    :return: (resp, content) of the last attempt, see load_stream.
+    """
+
+    # loaded with the http session, see utils.http_session
+    import requests
+
+    for attempt in range(retries + 1):
+        api_limiter.acquire()
+        try:
+            resp, content = load_stream(url, ua, headers)
+        except requests.RequestException:
+            if attempt == retries:
+                raise
+            resp, content = {"status": None}, None
+
+        wait = retry_policy(resp, attempt, retries)
+        if wait is None:
+            return resp, content
+
+        time.sleep(wait)
+        status = resp["status"]
+        stats.recorder.record("wait", wait, url=url, status=int(status) if status is not None else None, retries=1)
+
+
+def retry_policy(resp, attempt, retries, limiter=api_limiter):
+    """
+        the retry policy of request, shared with the async client: a success raises the rate of limiter, 429 and 503
+        slow it down.
+
+    :param resp: response of the attempt, {"status": None} if no response was received.
+    :param attempt: attempts made before this one.
+    :return: seconds to wait before the next attempt, None if resp is final.
+    """
+    status = resp["status"]
+    if status in ["200", "304"]:
+        limiter.reward()
+        return None
+
+    if status is not None and status not in _RETRY_STATUS:
+        return None
+
+    retry_after = utils.retry_after_seconds(resp.get("retry-after"))
+    if status in ["429", "503"]:
+        limiter.penalize(retry_after)
+
+    if attempt == retries:
+        return None
+    return retry_after if retry_after is not None else backoff(attempt)
+
+
+def backoff(attempt):
+    """
+        :return: seconds to wait before retry number attempt + 1, exponential with jitter.
+    """
+    return min(const.BACKOFF_MAX, const.BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1)
 
 
 def load_text_stream(url, ua=const.USER_AGENT):
     # print("load_page():", url)
-    h = Http()
-    headers = {'User-Agent': ua}
-
-    resp, content = h.request(url, 'GET', headers=headers)
+    resp, content = load_stream(url, ua)
     c = ""
     try:
         c = str(content, encoding='utf8', errors='ignore')
@@ -29,8 +123,13 @@ def load_text_stream(url, ua=const.USER_AGENT):
     return resp, c
 
 
-def do_query(search_query=None, id_list=None, start=0, max_results=10):
-    baseurl = "http://export.arxiv.org/api/query?"
+def query_url(search_query=None, id_list=None, start=0, max_results=10, sort_by=None, sort_order=None):
+    """
+        :param sort_by: "relevance", "lastUpdatedDate" or "submittedDate", None for the api's default.
+        :param sort_order: "ascending" or "descending".
+        :return: the api url of a query, see do_query.
+    """
+    baseurl = const.API_URL + "?"
 
     param_list = ""
     if type(search_query) is str and search_query != "":
@@ -50,90 +149,219 @@ def do_query(search_query=None, id_list=None, start=0, max_results=10):
     elif type(id_list) is str and id_list != "":
         param_list += "id_list=" + id_list + "&"
 
+    if sort_by is not None:
+        param_list += "sortBy=" + sort_by + "&"
+    if sort_order is not None:
+        param_list += "sortOrder=" + sort_order + "&"
+
     param_list += "start=" + str(start) + "&"
     param_list += "max_results=" + str(max_results)
 
-    url = baseurl + param_list
+    return baseurl + param_list
+
 
-    resp, cont = load_text_stream(url)
+def parse_response(cont, keep_xml=False):
+    """
+        parse the body of a successful api response and save its entries to the local index.
+
+    :return: model.Feed
+    """
+    feed = model.Feed()
+    if keep_xml:
+        feed.xml = str(cont, encoding='utf8', errors='ignore')
+    t = time.perf_counter()
+    feed.entries = list(iter_entries(cont, feed))
+    t_parsed = time.perf_counter()
+    localdb.index.add(feed.entries)
+    stats.recorder.record("parse", t_parsed - t, bytes=len(cont), entries=len(feed.entries))
+    stats.recorder.record("index", time.perf_counter() - t_parsed, entries=len(feed.entries))
+    return feed
+
+
+def do_query(search_query=None, id_list=None, start=0, max_results=10, keep_xml=False, sort_by=None,
+             sort_order=None):
+    """
+        :param keep_xml: keep the raw response in feed.xml
+        :param sort_by: see query_url
+        :return: response dict, resp["feed"] is a model.Feed or None if the query failed.
+    """
+    if type(id_list) is list and len(",".join(str(s_id) for s_id in id_list)) > const.MAX_ID_LIST_LENGTH:
+        # too long for one url, fetch it in chunks (see plan_query) and page through the merged results
+        entries, ok = query(search_query=search_query, id_list=id_list)
+        if not ok:
+            return {"status": "503", "feed": None}
+        page = entries[start:start + max_results]
+        return {"status": "200",
+                "feed": model.Feed(total=len(entries), start_index=start, count=len(page), entries=page)}
+
+    url = query_url(search_query, id_list, start, max_results, sort_by, sort_order)
+
+    t = time.perf_counter()
+    use_cache = response_cache.enabled and not response_cache.refresh and not keep_xml
+    feed = feed_cache.get(url) if use_cache else None
+    if feed is not None:
+        stats.recorder.record("cache", time.perf_counter() - t, url=url, entries=len(feed.entries))
+        return {"status": "200", "feed": feed}
+
+    cont = response_cache.get(url)
+    if cont is not None:
+        resp = {"status": "200"}
+        stats.recorder.record("cache", time.perf_counter() - t, url=url, bytes=len(cont))
+    else:
+        # an expired response is revalidated if it came with an etag or last-modified
+        stale = response_cache.stale(url)
+        resp, cont = request(url, headers=utils.conditional_headers(stale[1]) if stale is not None else None)
+        if resp['status'] == '304' and stale is not None:
+            resp['status'], cont = '200', stale[0]
+            response_cache.renew(url)
+        elif resp['status'] == '200':
+            response_cache.put(url, cont, utils.response_validators(resp))
 
     if resp['status'] == '200':
-        lxml_etree = etree.fromstring(cont.encode('utf8'))
+        resp["feed"] = parse_response(cont, keep_xml)
+        if not keep_xml and response_cache.enabled:
+            feed_cache.put(url, resp["feed"])
+    else:
+        resp["feed"] = None
 
-        feed = {}
+    return resp
 
-        # print(entries)
-        # element:{.tag: str, .tail: element, .text: str, .attrib: <class 'lxml.etree._Attrib'>}
 
-        title = lxml_etree.xpath("/atom:feed/atom:title", namespaces=const.xml_namespace)[0]
-        feed["xml"] = cont
-        feed["title"] = {"attrib": dict(title.attrib), "text": title.text}
+def iter_query(search_query=None, id_list=None, start=0, max_results=None, page_size=const.PAGE_SIZE):
+    """
+        walk through the results of a query page by page, lazily.
 
-        results_total = lxml_etree.xpath("/atom:feed/opensearch:totalResults", namespaces=const.xml_namespace)[0]
-        results_start = lxml_etree.xpath("/atom:feed/opensearch:startIndex", namespaces=const.xml_namespace)[0]
-        results_count = lxml_etree.xpath("/atom:feed/opensearch:itemsPerPage", namespaces=const.xml_namespace)[0]
-        feed["opensearch"] = {}
-        feed["opensearch"]["result-statics"] = {"total": int(results_total.text),
-                                                "start-index": int(results_start.text),
-                                                "count": int(results_count.text)}
+        the next page is fetched in background while the caller consumes the current one, requests are spaced by
+        api_limiter. paging stops at opensearch:totalResults, on an empty page, or when a request fails.
 
-        feed["entries"] = []
-        entries = lxml_etree.xpath("/atom:feed/atom:entry", namespaces=const.xml_namespace)
+    :param max_results: stop after this many entries, None for all results of the query.
+    :param page_size: max_results of each request.
+    :return: generator of model.Entry
+    """
 
-        for e in entries:
-            ent_url = e.xpath("./atom:id", namespaces=const.xml_namespace)
-            if len(ent_url) > 0:
-                ent_url = e.xpath("./atom:id", namespaces=const.xml_namespace)[0].text
-            else:
-                continue
-            ent_url = e.xpath("./atom:id", namespaces=const.xml_namespace)[0].text
-            ent_updated = e.xpath("./atom:updated", namespaces=const.xml_namespace)[0].text
-            ent_published = e.xpath("./atom:published", namespaces=const.xml_namespace)[0].text
-            ent_title = e.xpath("./atom:title", namespaces=const.xml_namespace)[0].text
-
-            ent_summary = e.xpath("./atom:summary", namespaces=const.xml_namespace)
-            if len(ent_summary) > 0:
-                ent_summary = ent_summary[0].text
-            else:
-                ent_summary = ""
+    end = None if max_results is None else start + max_results
 
-            ent_comment = e.xpath("./arxiv:comment", namespaces=const.xml_namespace)
-            if len(ent_comment) > 0:
-                ent_comment = ent_comment[0].text
-            else:
-                ent_comment = ""
+    def fetch(offset):
+        count = page_size if end is None else min(page_size, end - offset)
+        return do_query(search_query=search_query, id_list=id_list, start=offset, max_results=count)
 
-            ent_authors = []
-            for a in e.xpath("./atom:author/atom:name", namespaces=const.xml_namespace):
-                ent_authors.append(a.text)
+    import concurrent.futures
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    try:
+        offset = start
+        pending = pool.submit(fetch, offset)
+        while pending is not None:
+            resp = pending.result()
+            pending = None
 
-            ent_related_links = []
-            for l in e.xpath("./atom:link", namespaces=const.xml_namespace):
-                ent_related_links.append(dict(l.attrib))
+            feed = resp["feed"]
+            if feed is None:
+                return
 
-            ent_category = []
-            for c in e.xpath("./arxiv:primary_category/arxiv:category", namespaces=const.xml_namespace):
-                ent_category.append(dict(c.attrib))
+            offset += len(feed.entries)
+            if end is None or end > feed.total:
+                end = feed.total
 
-            ent_prim_cate = dict(e.xpath("./arxiv:primary_category", namespaces=const.xml_namespace)[0].attrib)
-            ent_prim_cate["category"] = ent_category
+            if len(feed.entries) > 0 and offset < end:
+                pending = pool.submit(fetch, offset)
 
-            ent = {"url": ent_url,
-                   "time": {"updated": ent_updated, "published": ent_published},
-                   "title": ent_title,
-                   "summary": ent_summary,
-                   "comment": ent_comment,
-                   "authors": ent_authors,
-                   "related-links": ent_related_links,
-                   "category": ent_prim_cate}
+            for e in feed.entries:
+                yield e
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
 
-            feed["entries"].append(ent)
 
-        resp["feed"] = feed
-    else:
-        resp["feed"] = None
+_ATOM = "{" + const.xml_namespace["atom"] + "}"
+_ARXIV = "{" + const.xml_namespace["arxiv"] + "}"
+_OPENSEARCH = "{" + const.xml_namespace["opensearch"] + "}"
 
-    return resp
+_FEED_TAGS = [_ATOM + "title", _OPENSEARCH + "totalResults", _OPENSEARCH + "startIndex", _OPENSEARCH + "itemsPerPage"]
+
+
+def iter_entries(source, feed=None):
+    """
+        incrementally parse an atom response, yields one model.Entry at a time and frees parsed elements on the way.
+
+    :param source: response body in bytes, or a binary file object.
+    :param feed: if given, feed level fields (title, opensearch statics) are filled into this model.Feed while parsing.
+    """
+
+    # lxml is loaded on the first response parsed, commands that never parse one do not pay for it
+    from lxml import etree
+
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+
+    for _, el in etree.iterparse(source, events=("end",), tag=[_ATOM + "entry"] + _FEED_TAGS):
+
+        if el.tag == _ATOM + "entry":
+            ent = _parse_entry(el)
+
+            # drop the entry and everything before it, the tree never holds more than one entry.
+            el.clear()
+            while el.getprevious() is not None:
+                del el.getparent()[0]
+
+            if ent is not None:
+                yield ent
+            continue
+
+        parent = el.getparent()
+        if parent is None or parent.tag != _ATOM + "feed" or feed is None:
+            continue
+
+        if el.tag == _ATOM + "title":
+            feed.title = el.text
+            feed.title_attrib = model.attrib_items(el.attrib)
+        elif el.tag == _OPENSEARCH + "totalResults":
+            feed.total = int(el.text)
+        elif el.tag == _OPENSEARCH + "startIndex":
+            feed.start_index = int(el.text)
+        elif el.tag == _OPENSEARCH + "itemsPerPage":
+            feed.count = int(el.text)
+
+
+def _parse_entry(e):
+    # single pass over the children of an atom:entry element
+    ent_url = None
+    ent_updated, ent_published, ent_title = None, None, None
+    ent_summary, ent_comment = "", ""
+    ent_authors, ent_related_links = [], []
+    ent_prim_cate, ent_category = {}, []
+    ent_categories = []
+
+    for c in e:
+        tag = c.tag
+        if tag == _ATOM + "id":
+            ent_url = c.text
+        elif tag == _ATOM + "updated":
+            ent_updated = c.text
+        elif tag == _ATOM + "published":
+            ent_published = c.text
+        elif tag == _ATOM + "title":
+            ent_title = c.text
+        elif tag == _ATOM + "summary":
+            ent_summary = c.text
+        elif tag == _ARXIV + "comment":
+            ent_comment = c.text
+        elif tag == _ATOM + "author":
+            for a in c.iterchildren(_ATOM + "name"):
+                ent_authors.append(a.text)
+        elif tag == _ATOM + "link":
+            ent_related_links.append(c.attrib)
+        elif tag == _ARXIV + "primary_category":
+            ent_prim_cate = c.attrib
+            ent_category = [cc.attrib for cc in c.iterchildren(_ARXIV + "category")]
+        elif tag == _ATOM + "category":
+            ent_categories.append(c.get("term"))
+
+    if ent_url is None:
+        return None
+
+    return model.Entry(ent_url, updated=ent_updated, published=ent_published, title=ent_title,
+                       summary=ent_summary, comment=ent_comment, authors=ent_authors,
+                       links=ent_related_links, category=ent_prim_cate, subcategories=ent_category,
+                       categories=ent_categories)
 
 
 def get_query_string(op_tree):
@@ -203,6 +431,54 @@ def get_query_string(op_tree):
         return None
 
 
+def parse_query_string(query_string):
+    """
+        parse an arXiv query string (e.g. 'ti:"sparse network" AND (au:han OR au:dally)') into an op-tree,
+        the inverse of get_query_string. operators are left associative, bare terms search all fields.
+
+    :return: op-tree, or None if the query string is malformed.
+    """
+
+    tokens = re.findall(r'\(|\)|[^\s():"]+:"[^"]*"|"[^"]*"|[^\s()]+', query_string)
+
+    def term(pos):
+        if pos >= len(tokens):
+            return None, pos
+        tok = tokens[pos]
+        if tok == "(":
+            tree, pos = expression(pos + 1)
+            if tree is None or pos >= len(tokens) or tokens[pos] != ")":
+                return None, pos
+            return tree, pos + 1
+        if tok in ["AND", "OR", "ANDNOT", ")"]:
+            return None, pos
+
+        field, _, value = tok.partition(":")
+        if value == "" or field not in "ti,au,abs,co,jr,cat,rn,id,all".split(","):
+            field, value = "all", tok
+        # quotes are kept, a quoted term is a phrase both in the api query and in the local index
+        return {"op": field, "term": value}, pos + 1
+
+    def expression(pos):
+        tree, pos = term(pos)
+        while tree is not None and pos < len(tokens) and tokens[pos] != ")":
+            op = tokens[pos]
+            if op in ["AND", "OR", "ANDNOT"]:
+                pos += 1
+            else:
+                op = "AND"
+            rhs, pos = term(pos)
+            if rhs is None:
+                return None, pos
+            tree = {"op": op.lower(), "term1": tree, "term2": rhs}
+        return tree, pos
+
+    tree, pos = expression(0)
+    if pos != len(tokens):
+        return None
+    return tree
+
+
 def do_search(query, ua=const.USER_AGENT, **kwargs):
     """
 
@@ -219,7 +495,7 @@ def do_search(query, ua=const.USER_AGENT, **kwargs):
 
     query = query.replace(":", " ")
 
-    url = 'http://export.arxiv.org/api/query?search_query=all:${Q}'.replace("${Q}", query)
+    url = (const.API_URL + '?search_query=all:${Q}').replace("${Q}", query)
     para_start, para_max_results = "start=0", "max_results=10"
 
     if "max_results" not in kwargs:
@@ -247,6 +523,233 @@ def check_id(id_name):
     return False
 
 
+def split_id_version(id_name):
+    """
+        split an arXiv ID into its base ID and version, e.g. "1807.05705v2" -> ("1807.05705", "v2")
+
+    :param id_name: arXiv ID, or the url of an entry (http://arxiv.org/abs/1807.05705v2)
+    :return: (base_id, version), version is None if not specified.
+    """
+
+    if "/abs/" in id_name:
+        id_name = id_name.split("/abs/", 1)[1]
+
+    m = const.REG_ID_VERSION.match(id_name)
+    return m.group(1), m.group(2)
+
+
+def _version_number(id_name):
+    _, version = split_id_version(id_name)
+    return int(version[1:]) if version is not None else 0
+
+
+def chunk_id_list(id_list, max_length=const.MAX_ID_LIST_LENGTH):
+    """
+        split id_list into chunks whose comma joined length fits in max_length.
+    """
+
+    chunks = []
+    chunk, length = [], 0
+    for s_id in id_list:
+        if len(chunk) > 0 and length + len(s_id) > max_length:
+            chunks.append(chunk)
+            chunk, length = [], 0
+        chunk.append(s_id)
+        length += len(s_id) + 1
+
+    if len(chunk) > 0:
+        chunks.append(chunk)
+
+    return chunks
+
+
+def resolve_ids(id_list):
+    """
+        look up a list of arXiv IDs with batched id_list queries instead of one query per ID.
+
+    :param id_list: list of arXiv IDs, with or without version.
+    :return: dict maps each requested ID to (feed, entry), IDs that are not found map to None.
+            the feed is shared by all entries of the same batch.
+    """
+
+    requested = []
+    for s_id in id_list:
+        if s_id not in requested:
+            requested.append(s_id)
+
+    resolved = {s_id: None for s_id in requested}
+
+    chunks = chunk_id_list(requested)
+    import concurrent.futures
+    with concurrent.futures.ThreadPoolExecutor(max_workers=const.PLANNER_JOBS) as pool:
+        responses = list(pool.map(lambda chunk: do_query(id_list=chunk, max_results=len(chunk)), chunks))
+
+    for chunk, resp in zip(chunks, responses):
+        if resp is None or resp["feed"] is None:
+            continue
+
+        feed = resp["feed"]
+        found = {}
+        for ent in feed.entries:
+            base_id, version = ent.id, ent.version
+            found[(base_id, version)] = ent
+
+            # an unversioned ID resolves to the latest version returned
+            latest = found.get((base_id, None))
+            if latest is None or _version_number(ent.url) > _version_number(latest.url):
+                found[(base_id, None)] = ent
+
+        for s_id in chunk:
+            ent = found.get(split_id_version(s_id))
+            if ent is not None:
+                resolved[s_id] = (feed, ent)
+
+    return resolved
+
+
+def split_op_tree(op_tree):
+    """
+        rewrite an op-tree as a list of op-trees whose results, together, are the results of op_tree: the branches
+        of an OR become separate trees, an AND is distributed over the side with more branches, an ANDNOT over its
+        first term.
+
+    :return: list of op-trees, [op_tree] if it can not be split.
+    """
+
+    if type(op_tree) is not dict or "term1" not in op_tree or "term2" not in op_tree:
+        return [op_tree]
+
+    op = op_tree.get("op").__str__()
+    term1, term2 = op_tree["term1"], op_tree["term2"]
+
+    if op == "or":
+        return split_op_tree(term1) + split_op_tree(term2)
+
+    if op == "and":
+        t1, t2 = split_op_tree(term1), split_op_tree(term2)
+        if len(t1) >= len(t2):
+            return [{"op": "and", "term1": t, "term2": term2} for t in t1]
+        return [{"op": "and", "term1": term1, "term2": t} for t in t2]
+
+    if op == "andnot":
+        return [{"op": "andnot", "term1": t, "term2": term2} for t in split_op_tree(term1)]
+
+    return [op_tree]
+
+
+def _group_queries(trees, max_length):
+    # OR together as many query strings of trees as fit in max_length
+    groups, group, length = [], [], 0
+    seen = set()
+    for tree in trees:
+        q = get_query_string(tree)
+        if q is None or q in seen:
+            continue
+        seen.add(q)
+
+        if len(group) > 0 and length + len(" OR ") + len(q) > max_length:
+            groups.append(group)
+            group, length = [], 0
+        length += len(q) + (len(" OR ") if len(group) > 0 else len("()"))
+        group.append(q)
+
+    if len(group) > 0:
+        groups.append(group)
+
+    return [g[0] if len(g) == 1 else "(" + " OR ".join(g) + ")" for g in groups]
+
+
+def plan_query(search_query=None, id_list=None, max_length=const.MAX_QUERY_LENGTH):
+    """
+        split a query that does not fit in one request into sub-queries: id_list into chunks (see chunk_id_list),
+        a search query longer than max_length into OR-groups of the branches found by split_op_tree.
+
+    :param search_query: query string or op-tree.
+    :param id_list: list of arXiv IDs, or a comma separated string.
+    :return: list of (search_query, id_list) sub-queries, the union of their results is the result of the query.
+    """
+
+    tree = None
+    if type(search_query) is dict:
+        tree = search_query
+        search_query = get_query_string(tree)
+
+    queries = [search_query]
+    if type(search_query) is str and len(search_query) > max_length:
+        if tree is None:
+            tree = parse_query_string(search_query)
+        if tree is not None:
+            queries = _group_queries(split_op_tree(tree), max_length) or queries
+
+    if type(id_list) is str:
+        id_list = [s_id for s_id in id_list.split(",") if s_id != ""]
+    chunks = chunk_id_list(id_list) if id_list else [None]
+
+    return [(q, chunk) for q in queries for chunk in chunks]
+
+
+def _fetch_sub_query(search_query, id_list, max_results):
+    # :return: (entries, True if every request succeeded)
+    if id_list is not None:
+        resp = do_query(search_query=search_query, id_list=id_list, max_results=len(id_list))
+        return (resp["feed"].entries, True) if resp["feed"] is not None else ([], False)
+
+    entries = []
+    while max_results is None or len(entries) < max_results:
+        count = const.PAGE_SIZE if max_results is None else min(const.PAGE_SIZE, max_results - len(entries))
+        resp = do_query(search_query=search_query, start=len(entries), max_results=count)
+        if resp["feed"] is None:
+            return entries, False
+
+        feed = resp["feed"]
+        entries.extend(feed.entries)
+        if len(feed.entries) == 0 or len(entries) >= feed.total:
+            break
+
+    return entries, True
+
+
+def query(search_query=None, id_list=None, start=0, max_results=None, jobs=const.PLANNER_JOBS):
+    """
+        run a query of any size: the sub-queries of plan_query run concurrently in jobs threads, their requests are
+        still spaced by api_limiter, so the threads overlap latency and parsing without raising the request rate.
+
+        results are merged in the order of the sub-queries, results of an id_list follow the requested order. an ID
+        returned by several sub-queries is kept once, at its first position, with the latest version returned.
+
+    :param search_query: query string or op-tree.
+    :param max_results: None for all results, otherwise every search sub-query fetches up to start + max_results.
+    :return: (list of model.Entry, True if every sub-query succeeded)
+    """
+
+    end = None if max_results is None else start + max_results
+    plan = plan_query(search_query, id_list)
+
+    import concurrent.futures
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(jobs, len(plan)))) as pool:
+        results = list(pool.map(lambda sub: _fetch_sub_query(sub[0], sub[1], end), plan))
+
+    merged, position = [], {}
+    for entries, _ in results:
+        for e in entries:
+            i = position.get(e.id)
+            if i is None:
+                position[e.id] = len(merged)
+                merged.append(e)
+            elif _version_number(e.url) > _version_number(merged[i].url):
+                merged[i] = e
+
+    if id_list:
+        if type(id_list) is str:
+            id_list = id_list.split(",")
+        rank = {}
+        for s_id in id_list:
+            rank.setdefault(split_id_version(s_id)[0], len(rank))
+        merged.sort(key=lambda e: rank.get(e.id, len(rank)))
+
+    return merged[start:end], all(ok for _, ok in results)
+
+
 # if __name__ == '__main__':
 #
 #     v = get_query_string({"op": "and", "term1": {"op": "abs", "term": "asdfasdf"}, "term2": "asdfa"})